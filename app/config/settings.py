@@ -160,6 +160,14 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MODEL_SIGNALS = ['client', 'brand', 'product',
                  'order', 'confirmation', 'invoice']
 
+IMPORT_STAGING_TTL = 2 * 60 * 60
+
+PARSE_CACHE_SIZE = 64
+
+IMPORT_WORKERS = int(os.getenv(ENV_PREFIX+'IMPORT_WORKERS', os.cpu_count() or 1))
+
+LIST_PAGE_SIZE = 50
+
 CELERY_TIMEZONE = 'UTC'
 CELERY_BROKER_URL = 'redis://localhost:6379/0' if os.getenv(
     ENV_PREFIX+'DB_HOST') == 'localhost' else 'redis://redis:6379/0'
@@ -171,7 +179,13 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(hour=3, day_of_week=6),
         'args': (),
         'options': {'queue': 'default'},
-    }
+    },
+    'purge_import_staging': {
+        'task': 'orderflow_app.tasks.purge_import_staging',
+        'schedule': crontab(minute=0),
+        'args': (),
+        'options': {'queue': 'default'},
+    },
 }
 
 LOGGING = {
@@ -27,6 +27,9 @@ from .models.cancellations import (
     Cancellation,
     CancellationItem,
 )
+from .models.openquantities import (
+    OpenQuantity,
+)
 
 
 @admin.action(description='Export selected')
@@ -245,3 +248,15 @@ class CancellationItemAdmin(admin.ModelAdmin):
     show_full_result_count = True
     fields = ("cancellation", "client", "product",
               "quantity", "confirmation__confirmation_code", )
+
+
+@admin.register(OpenQuantity)
+class OpenQuantityAdmin(admin.ModelAdmin):
+    list_display = (
+        "product__id", "client__name", "quantity", "confirmation__confirmation_code", "order__id", )
+    ordering = ("product", "order__order_date", "confirmation__confirmation_date")
+    search_fields = ("product__id",)
+    search_help_text = "Search product id"
+    list_filter = ("client__name", "confirmation__confirmation_code", )
+    show_full_result_count = True
+    readonly_fields = ("product", "client", "order", "confirmation", "quantity", )
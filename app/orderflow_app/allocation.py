@@ -0,0 +1,45 @@
+from collections import defaultdict
+
+BALANCE_KEY = ("client_id", "confirmation_id", "order_id")
+
+
+def sum_per_key(rows, key_fields):
+    result = defaultdict(int)
+    for row in rows:
+        result[tuple(row[field] for field in key_fields)] += row["quantity"]
+    return result
+
+
+def left_quantities(available_rows, consumed_rows, key_fields=BALANCE_KEY):
+    available_per_key = {}
+    for row in available_rows:
+        key = tuple(row[field] for field in key_fields)
+        if key in available_per_key:
+            available_per_key[key]["quantity"] += row["quantity"]
+        else:
+            available_per_key[key] = dict(row)
+    consumed_per_key = defaultdict(int)
+    for rows in consumed_rows:
+        for key, quantity in sum_per_key(rows, key_fields).items():
+            consumed_per_key[key] += quantity
+    available_quantity = sum(row["quantity"]
+                             for row in available_per_key.values())
+    if available_quantity - sum(consumed_per_key.values()) <= 0:
+        return []
+    result = []
+    for key, row in available_per_key.items():
+        left_quantity = row["quantity"] - consumed_per_key.get(key, 0)
+        if left_quantity > 0:
+            result.append({**row, "quantity": left_quantity})
+    return result
+
+
+def allocate(quantity, balances):
+    allocations = []
+    for balance in balances:
+        if quantity <= 0:
+            break
+        allocated_quantity = min(quantity, balance["quantity"])
+        quantity -= allocated_quantity
+        allocations.append({**balance, "quantity": allocated_quantity})
+    return allocations, quantity
@@ -0,0 +1,306 @@
+import json
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, models, transaction
+
+from . import parsers
+from .forms.uploadfile import UploadFileForm
+from .models.directories import Client, Product, Supplier
+from .models.orders import Order, OrderItem
+from .models.confirmations import Confirmation, ConfirmationItem, ConfirmationDelivery
+from .models.invoices import Invoice, InvoiceItem
+from .models.openquantities import OpenQuantity
+
+log = logging.getLogger(__name__)
+
+KINDS = (parsers.ORDER, parsers.CONFIRMATION, parsers.INVOICE)
+
+COPY_COLUMNS = {
+    OrderItem: ("order_id", "client_id", "product_id", "quantity"),
+    ConfirmationItem: ("confirmation_id", "client_id", "product_id", "order_id", "quantity", "price"),
+    ConfirmationDelivery: ("confirmation_id", "product_id", "quantity", "delivery_date"),
+    InvoiceItem: ("invoice_id", "client_id", "product_id", "confirmation_id", "order_id",
+                  "quantity", "price"),
+}
+
+
+@dataclass
+class Document:
+    kind: str
+    file_name: str
+    supplier: Supplier
+    document_date: date
+    code: str | None
+    data: list
+    file_hash: str
+
+
+def read_archive(paths):
+    groups = defaultdict(list)
+    failed = []
+    for path in paths:
+        if file_parsers := parsers.parsers_for(path.name):
+            groups[file_parsers[0]].append(path)
+        else:
+            failed.append((path.name, "no layout matches the file name"))
+    suppliers = Supplier.objects.in_bulk({parser.supplier_id for parser in groups})
+    documents = []
+    for file_parser, group_paths in groups.items():
+        if (supplier := suppliers.get(file_parser.supplier_id)) is None:
+            failed += [(path.name, f"no supplier {file_parser.supplier_id}")
+                       for path in group_paths]
+            continue
+        uploaded_files = [SimpleUploadedFile(path.name, path.read_bytes())
+                          for path in group_paths]
+        results = parsers.parse_files(uploaded_files, supplier, file_parser.layout.kind)
+        for uploaded_file, parsed in zip(uploaded_files, results):
+            document_date = file_parser.document_date(uploaded_file.name)
+            if isinstance(parsed, Exception):
+                failed.append((uploaded_file.name, str(parsed)))
+            elif document_date is None:
+                failed.append((uploaded_file.name, "no date in file name"))
+            else:
+                documents.append(Document(
+                    kind=file_parser.layout.kind,
+                    file_name=uploaded_file.name,
+                    supplier=supplier,
+                    document_date=document_date,
+                    code=parsed[0],
+                    data=json.loads(UploadFileForm.data_json(parsed[1])),
+                    file_hash=parsers.file_hash(uploaded_file),
+                ))
+    documents.sort(key=lambda document: (
+        document.document_date, KINDS.index(document.kind), document.file_name))
+    return documents, failed
+
+
+class Ledger:
+    def __init__(self):
+        self.ordered = defaultdict(lambda: defaultdict(int))
+        self.confirmed = defaultdict(lambda: defaultdict(int))
+        self.order_totals = defaultdict(lambda: [0, 0])
+        self.orders = {}
+        self.confirmation_dates = {}
+        self.open_quantities = defaultdict(lambda: defaultdict(int))
+
+    def load(self, product_ids):
+        for item in OrderItem.objects.filter(product_id__in=product_ids).values(
+                "order_id", "product_id", "client_id").annotate(
+                quantity=models.Sum("quantity")).order_by():
+            self.add_ordered(item["order_id"], item["product_id"],
+                             item["client_id"], item["quantity"])
+        for item in ConfirmationItem.objects.filter(
+                product_id__in=product_ids, order__isnull=False).values(
+                "order_id", "product_id", "client_id").annotate(
+                quantity=models.Sum("quantity")).order_by():
+            self.add_confirmed(item["order_id"], item["product_id"],
+                               item["client_id"], item["quantity"])
+        self.orders.update(Order.objects.in_bulk(
+            {order_id for order_id, _ in self.ordered}))
+        for open_quantity in OpenQuantity.objects.filter(product_id__in=product_ids).values(
+                "product_id", "client_id", "confirmation_id", "order_id", "quantity",
+                "confirmation__confirmation_date").order_by("id"):
+            self.confirmation_dates[open_quantity["confirmation_id"]] = open_quantity[
+                "confirmation__confirmation_date"]
+            self.open_quantities[open_quantity["product_id"]][(
+                open_quantity["client_id"], open_quantity["confirmation_id"],
+                open_quantity["order_id"])] += open_quantity["quantity"]
+        self.orders.update(Order.objects.in_bulk(
+            {key[2] for keys in self.open_quantities.values() for key in keys} - {None}
+            - self.orders.keys()))
+
+    def add_ordered(self, order_id, product_id, client_id, quantity):
+        self.ordered[(order_id, product_id)][client_id] += quantity
+        self.order_totals[order_id][0] += quantity
+
+    def add_confirmed(self, order_id, product_id, client_id, quantity):
+        self.confirmed[(order_id, product_id)][client_id] += quantity
+        self.order_totals[order_id][1] += quantity
+
+    def unconfirmed(self, supplier, confirmation_date):
+        return sorted((order for order_id, order in self.orders.items()
+                       if order.supplier_id == supplier.pk
+                       and order.order_date <= confirmation_date
+                       and self.order_totals[order_id][0] > self.order_totals[order_id][1]),
+                      key=lambda order: (order.order_date, order.id), reverse=True)
+
+    def order_quantities(self, orders, product_ids):
+        ordered_quantity = defaultdict(list)
+        confirmed_quantity = defaultdict(list)
+        for result, quantities in ((ordered_quantity, self.ordered),
+                                   (confirmed_quantity, self.confirmed)):
+            for order in orders:
+                for product_id in product_ids:
+                    result[(order.id, product_id)] = [
+                        {'client_id': client_id, 'quantity': quantity}
+                        for client_id, quantity in sorted(
+                            quantities.get((order.id, product_id), {}).items())]
+        return ordered_quantity, confirmed_quantity
+
+    def balance_order(self, key, position):
+        _, confirmation_id, order_id = key
+        order = self.orders.get(order_id)
+        confirmation_date = self.confirmation_dates.get(confirmation_id)
+        return (order is None, order.order_date if order else None,
+                confirmation_date is None, confirmation_date, position)
+
+    def open_balances(self, product_ids, confirmation_date):
+        result = {}
+        for product_id in product_ids:
+            open_quantities = [
+                (self.balance_order(key, position), key, quantity)
+                for position, (key, quantity) in enumerate(self.open_quantities[product_id].items())
+                if key[1] is None or self.confirmation_dates[key[1]] <= confirmation_date]
+            if sum(quantity for _, _, quantity in open_quantities) <= 0:
+                continue
+            result[product_id] = [
+                {'client_id': key[0], 'confirmation_id': key[1], 'order_id': key[2],
+                 'quantity': quantity}
+                for _, key, quantity in sorted(open_quantities, key=lambda row: row[0])
+                if key[1] is not None and quantity > 0]
+        return result
+
+    def add_order(self, order, items):
+        self.orders[order.id] = order
+        for item in items:
+            self.add_ordered(order.id, item['product_id'], item['client_id'], item['quantity'])
+
+    def add_confirmation(self, confirmation, items):
+        self.confirmation_dates[confirmation.id] = confirmation.confirmation_date
+        for item in items:
+            if item['order_id'] is not None:
+                self.add_confirmed(item['order_id'], item['product_id'],
+                                   item['client_id'], item['quantity'])
+            self.open_quantities[item['product_id']][(
+                item['client_id'], confirmation.id, item['order_id'])] += item['quantity']
+
+    def add_invoice(self, items):
+        for item in items:
+            self.open_quantities[item['product_id']][(
+                item['client_id'], item['confirmation_id'], item['order_id'])] -= item['quantity']
+
+
+class Backfill:  # pylint: disable=R0902
+    def __init__(self, documents):
+        self.documents = documents
+        self.ledger = Ledger()
+        self.clients = set()
+        self.created = {model: [] for model in (Order, Confirmation, Invoice)}
+        self.products = {kind: [] for kind in KINDS}
+        self.rows = {model: [] for model in COPY_COLUMNS}
+        self.confirmation_orders = []
+        self.ids = set()
+
+    @staticmethod
+    def product_ids(documents):
+        return {item['product'] for document in documents for item in document.data
+                if item.get('product') not in ("", "total", None)}
+
+    def check_id(self, model, document_id):
+        if (model, document_id) in self.ids:
+            raise ValueError(f"{model.__name__} {document_id} already exists")
+        self.ids.add((model, document_id))
+
+    def add_order(self, document):
+        order = Order(id=Order.name_into_id(document.file_name), name=document.file_name,
+                      order_date=document.document_date, supplier=document.supplier,
+                      file_hash=document.file_hash)
+        self.check_id(Order, order.id)
+        products, items = OrderItem.plan_order_items(document.data)
+        if unknown_clients := {item['client_id'] for item in items} - self.clients:
+            raise ValueError(
+                f"Unknown clients: {', '.join(sorted(map(str, unknown_clients)))}")
+        self.ledger.add_order(order, items)
+        self.products[parsers.ORDER] += products
+        self.rows[OrderItem] += [{'order_id': order.id, **item} for item in items]
+        return order
+
+    def add_confirmation(self, document):
+        confirmation = Confirmation(
+            id=document.code, name=document.file_name, confirmation_code=document.code,
+            confirmation_date=document.document_date, supplier=document.supplier,
+            file_hash=document.file_hash)
+        self.check_id(Confirmation, confirmation.id)
+        orders = self.ledger.unconfirmed(document.supplier, document.document_date)
+        products, items = ConfirmationItem.plan_confirmation_items(
+            document.data, orders, order_quantities=self.ledger.order_quantities)
+        self.ledger.add_confirmation(confirmation, items)
+        self.products[parsers.CONFIRMATION] += products
+        self.confirmation_orders += [(confirmation.id, order.id) for order in orders]
+        self.rows[ConfirmationItem] += [
+            {'confirmation_id': confirmation.id, **item} for item in items]
+        self.rows[ConfirmationDelivery] += [
+            {'confirmation_id': confirmation.id, **item}
+            for item in ConfirmationDelivery.plan_confirmation_delivery(document.data)]
+        return confirmation
+
+    def add_invoice(self, document):
+        invoice = Invoice(id=Invoice.name_into_id(document.file_name), name=document.file_name,
+                          invoice_date=document.document_date, supplier=document.supplier,
+                          file_hash=document.file_hash)
+        self.check_id(Invoice, invoice.id)
+        products, items = InvoiceItem.plan_invoice_items(
+            document.data, document.document_date, open_balances=self.ledger.open_balances)
+        self.ledger.add_invoice(items)
+        self.products[parsers.INVOICE] += products
+        self.rows[InvoiceItem] += [{'invoice_id': invoice.id, **item} for item in items]
+        return invoice
+
+    def allocate(self):
+        self.clients = set(Client.objects.values_list("id", flat=True))
+        for model, document_ids in (
+                (Order, [Order.name_into_id(document.file_name)
+                         for document in self.documents if document.kind == parsers.ORDER]),
+                (Confirmation, [document.code for document in self.documents
+                                if document.kind == parsers.CONFIRMATION]),
+                (Invoice, [Invoice.name_into_id(document.file_name)
+                           for document in self.documents if document.kind == parsers.INVOICE])):
+            self.ids |= {(model, document_id) for document_id in model.objects.filter(
+                pk__in=document_ids).values_list("pk", flat=True)}
+        self.ledger.load(self.product_ids(self.documents))
+        adders = {parsers.ORDER: self.add_order,
+                  parsers.CONFIRMATION: self.add_confirmation,
+                  parsers.INVOICE: self.add_invoice}
+        failed = []
+        for document in self.documents:
+            try:
+                created = adders[document.kind](document)
+            except Exception as e:  # pylint: disable=W0718
+                failed.append((document.file_name, str(e)))
+                continue
+            self.created[type(created)].append(created)
+        return failed
+
+    @staticmethod
+    def copy(model, rows):
+        columns = COPY_COLUMNS[model]
+        table = model._meta.db_table  # pylint: disable=W0212
+        with connection.cursor() as cursor:
+            with cursor.copy(f'COPY {table} ({", ".join(columns)}) FROM STDIN') as copy:
+                for row in rows:
+                    copy.write_row([row.get(column) for column in columns])
+
+    def write(self):
+        with transaction.atomic():
+            if any(row['client_id'] == "Unknown"
+                   for model in (ConfirmationItem, InvoiceItem) for row in self.rows[model]):
+                Client.objects.get_or_create(id="Unknown")
+            Product.register_products(self.products[parsers.ORDER])
+            Product.register_products(self.products[parsers.CONFIRMATION],
+                                      update_fields=['name', 'brand_id'])
+            Product.register_products(self.products[parsers.INVOICE])
+            for model, documents in self.created.items():
+                model.objects.bulk_create(documents)
+            Confirmation.order.through.objects.bulk_create(
+                Confirmation.order.through(confirmation_id=confirmation_id, order_id=order_id)
+                for confirmation_id, order_id in self.confirmation_orders)
+            for model, rows in self.rows.items():
+                self.copy(model, rows)
+            OpenQuantity.rebuild(sorted({row['product_id']
+                                         for model in (ConfirmationItem, InvoiceItem)
+                                         for row in self.rows[model]}))
+        return {model.__name__: len(rows) for model, rows in self.rows.items()}
@@ -62,45 +62,47 @@ class CancellationModelForm(forms.ModelForm):
                      if x.lower() in ["order", "item", "qty"]]
         if len(cancellation_list) % len(dict_keys):
             raise ValidationError("Invalid data size")
+        rows = [dict(zip(dict_keys, cancellation_list[i:i+len(dict_keys)]))
+                for i in range(len(dict_keys), len(cancellation_list), len(dict_keys))]
+        if "item" in dict_keys:
+            for row in rows:
+                value = row["item"]
+                if brand.id == "B05":
+                    value = value.zfill(14)
+                row["item"] = f'{value}_{brand.id}'
+            product_ids = {row["item"] for row in rows}
+            if Product.objects.filter(id__in=product_ids).count() != len(product_ids):
+                raise ValidationError("Invalid item")
+        if "order" in dict_keys:
+            confirmation_ids = {row["order"] for row in rows}
+            if Confirmation.objects.filter(id__in=confirmation_ids).count() != len(confirmation_ids):
+                raise ValidationError("Invalid confirmation")
+        if "qty" in dict_keys:
+            if not "item" in dict_keys:
+                raise ValidationError("Qty does not make sense without item")
+            for row in rows:
+                try:
+                    row["qty"] = int(row["qty"])
+                except ValueError as e:
+                    raise ValidationError("Invalid qty") from e
+                if row["qty"] <= 0:
+                    raise ValidationError("Invalid qty")
+        if not "item" in dict_keys:
+            return list(ConfirmationItem.objects.filter(
+                confirmation_id__in=confirmation_ids).values(
+                    "confirmation", "product").distinct().order_by("confirmation", "product"))
         result = []
-        i = len(dict_keys)
-        while i < len(cancellation_list):
-            cancellation_dict = {}
-            for j, key in enumerate(dict_keys):
-                item = {}
-                value = cancellation_list[i+j]
-                if key == "item":
-                    if brand.id == "B05":
-                        value = value.zfill(14)
-                    product_id = f'{value}_{brand.id}'
-                    if not Product.objects.filter(id=product_id).exists():
-                        raise ValidationError("Invalid item")
-                    item = {'product': product_id}
-                elif key == "qty":
-                    try:
-                        if int(value) > 0:
-                            item = {'quantity': int(value)}
-                        else:
-                            raise ValidationError("Invalid qty")
-                    except Exception as e:
-                        raise ValidationError("Invalid qty") from e
-                elif key == "order":
-                    if not Confirmation.objects.filter(id=value).exists():
-                        raise ValidationError("Invalid confirmation")
-                    if not "item" in dict_keys:
-                        if "qty" in dict_keys:
-                            raise ValidationError(
-                                "Qty does not make sense without item")
-                        cancellation_dicts = ConfirmationItem.objects.filter(
-                            confirmation_id=value).values("confirmation", "product").distinct()
-                        result += cancellation_dicts
-                    else:
-                        item = {'confirmation': value}
-                if item:
-                    cancellation_dict.update(item)
-                    if cancellation_dict not in result:
-                        result.append(cancellation_dict)
-            i += len(dict_keys)
+        seen = set()
+        for row in rows:
+            cancellation_dict = {'product': row["item"]}
+            if "order" in row:
+                cancellation_dict['confirmation'] = row["order"]
+            if "qty" in row:
+                cancellation_dict['quantity'] = row["qty"]
+            key = tuple(sorted(cancellation_dict.items()))
+            if key not in seen:
+                seen.add(key)
+                result.append(cancellation_dict)
         if not cancellation_data:
             raise ValidationError("No data")
         return result
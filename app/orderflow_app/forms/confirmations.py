@@ -11,6 +11,7 @@ from django.db.models import Sum
 from ..models.directories import (
     Product,
     Client,
+    Supplier,
 )
 from ..models.confirmations import (
     Confirmation,
@@ -125,24 +126,43 @@ class EditConfirmationModelForm(ViewConfirmationModelForm):
         return orders
 
 
+class ConfirmationFilterForm(forms.Form):
+    supplier = forms.ChoiceField(
+        required=False, label='Supplier',
+        widget=forms.Select(attrs={'class': 'form-select form-select-sm'}))
+    date_from = forms.DateField(
+        required=False, label='From',
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+    date_to = forms.DateField(
+        required=False, label='To',
+        widget=forms.DateInput(attrs={'class': 'form-control form-control-sm', 'type': 'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['supplier'].choices = [('', '---------')] + [
+            (supplier.id, str(supplier)) for supplier in Supplier.objects.all()]
+
+    def filter(self, queryset):
+        if not self.is_valid():
+            return queryset
+        if supplier := self.cleaned_data['supplier']:
+            queryset = queryset.filter(supplier_id=supplier)
+        if date_from := self.cleaned_data['date_from']:
+            queryset = queryset.filter(confirmation_date__gte=date_from)
+        if date_to := self.cleaned_data['date_to']:
+            queryset = queryset.filter(confirmation_date__lte=date_to)
+        return queryset
+
+
 class ProductPriceSelectWidget(forms.Select):
-    def __init__(self, *args, confirmation=None, **kwargs):  # pylint: disable=R0914
+    def __init__(self, *args, prices=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.confirmation = confirmation
+        self.prices = prices or {}
 
     def create_option(self, name, value, label, selected, index, **kwargs):  # pylint: disable=W0221,R0913,R0917
         option = super().create_option(name, value, label, selected, index, **kwargs)
-        if value and self.confirmation:
-            try:
-                confirmation_item = ConfirmationItem.objects.filter(
-                    confirmation=self.confirmation,
-                    product_id=value
-                ).first()
-                if confirmation_item:
-                    price = confirmation_item.price
-                    option['attrs']['data-price'] = f'{price}'
-            except Exception as e:  # pylint: disable=W0718
-                raise ValidationError(f'No price for {value} :{str(e)}') from e
+        if value and (price := self.prices.get(str(value))) is not None:
+            option['attrs']['data-price'] = f'{price}'
         return option
 
 
@@ -159,7 +179,7 @@ class BaseConfirmationItemModelForm(forms.ModelForm):
             'comment': 'Comment'
         }
         widgets = {
-            'product': ProductPriceSelectWidget(confirmation=None, attrs={
+            'product': ProductPriceSelectWidget(attrs={
                 'style': 'width: 180px',
                 'class': 'form-control'}),
             'quantity': forms.NumberInput(attrs={
@@ -216,7 +236,7 @@ class ConfirmationItemFormSet(BaseModelFormSet):
         confirmation = kwargs.pop('form_kwargs', {}).get('confirmation')
         super().__init__(*args, **kwargs)
         self.confirmation = confirmation
-        self.queryset = ConfirmationItem.objects.filter(
+        self.queryset = ConfirmationItem.objects.with_totals().filter(
             confirmation=confirmation)
         self.deletion_widget = forms.CheckboxInput({
             'onclick': 'return confirm("Do you really want to delete the record?");'
@@ -224,6 +244,9 @@ class ConfirmationItemFormSet(BaseModelFormSet):
         self._initialize_widgets()
 
     def _initialize_widgets(self):
+        prices = dict(ConfirmationItem.objects.filter(
+            confirmation=self.confirmation
+        ).order_by('product_id', 'id').distinct('product_id').values_list('product_id', 'price'))
         products = Product.objects.filter(
             confirmed__confirmation=self.confirmation
         ).distinct()
@@ -231,7 +254,7 @@ class ConfirmationItemFormSet(BaseModelFormSet):
             confirmed_products__confirmation=self.confirmation
         ).distinct()
         for form in self.forms:
-            form.fields['product'].widget.confirmation = self.confirmation
+            form.fields['product'].widget.prices = prices
             form.fields['product'].queryset = products
             form.fields['client'].queryset = clients
 
@@ -289,7 +312,7 @@ class ConfirmationItemFormSet(BaseModelFormSet):
 
     def export_to_excel(self):
         df = pd.DataFrame([
-            dict(form.initial.items())
+            {**form.initial, 'amount': form.instance.total_amount}
             for form in self.forms
         ])
         if df.empty:
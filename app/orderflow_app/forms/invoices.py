@@ -84,23 +84,14 @@ class EditInvoiceModelForm(ViewInvoiceModelForm):
 
 
 class ProductPriceSelectWidget(forms.Select):
-    def __init__(self, *args, invoice=None, **kwargs):  # pylint: disable=R0914
+    def __init__(self, *args, prices=None, **kwargs):
         super().__init__(*args, **kwargs)
-        self.invoice = invoice
+        self.prices = prices or {}
 
     def create_option(self, name, value, label, selected, index, **kwargs):  # pylint: disable=W0221,R0913,R0917
         option = super().create_option(name, value, label, selected, index, **kwargs)
-        if value and self.invoice:
-            try:
-                invoice_item = InvoiceItem.objects.filter(
-                    invoice=self.invoice,
-                    product_id=value
-                ).first()
-                if invoice_item:
-                    price = invoice_item.price
-                    option['attrs']['data-price'] = f'{price}'
-            except Exception as e:  # pylint: disable=W0718
-                raise ValidationError(f'No price for {value} :{str(e)}') from e
+        if value and (price := self.prices.get(str(value))) is not None:
+            option['attrs']['data-price'] = f'{price}'
         return option
 
 
@@ -119,7 +110,7 @@ class BaseInvoiceItemModelForm(forms.ModelForm):
             'comment': 'Comment'
         }
         widgets = {
-            'product': ProductPriceSelectWidget(invoice=None, attrs={
+            'product': ProductPriceSelectWidget(attrs={
                 'style': 'width: 180px',
                 'class': 'form-control'}),
             'quantity': forms.NumberInput(attrs={
@@ -182,7 +173,7 @@ class InvoiceItemFormSet(BaseModelFormSet):
         invoice = kwargs.pop('form_kwargs', {}).get('invoice')
         super().__init__(*args, **kwargs)
         self.invoice = invoice
-        self.queryset = InvoiceItem.objects.filter(
+        self.queryset = InvoiceItem.objects.with_totals().filter(
             invoice=invoice)
         self.deletion_widget = forms.CheckboxInput({
             'onclick': 'return confirm("Do you really want to delete the record?");'
@@ -190,11 +181,14 @@ class InvoiceItemFormSet(BaseModelFormSet):
         self._initialize_widgets()
 
     def _initialize_widgets(self):
+        prices = dict(InvoiceItem.objects.filter(
+            invoice=self.invoice
+        ).order_by('product_id', 'id').distinct('product_id').values_list('product_id', 'price'))
         products = Product.objects.filter(
             invoiced__invoice=self.invoice
         ).distinct()
         for form in self.forms:
-            form.fields['product'].widget.invoice = self.invoice
+            form.fields['product'].widget.prices = prices
             form.fields['product'].queryset = products
 
     def add_fields(self, form, index):
@@ -252,7 +246,7 @@ class InvoiceItemFormSet(BaseModelFormSet):
 
     def export_to_excel(self):
         df = pd.DataFrame([
-            dict(form.initial.items())
+            {**form.initial, 'amount': form.instance.total_amount}
             for form in self.forms
         ])
         if df.empty:
@@ -0,0 +1,154 @@
+import json
+import logging
+from abc import ABC, abstractmethod
+
+from django import forms
+
+from .forms.uploadfile import UploadFileForm
+from .forms.orders import OrderModelForm
+from .forms.confirmations import ConfirmationModelForm
+from .forms.invoices import InvoiceModelForm
+from .models.orders import Order, OrderItem
+from .models.confirmations import Confirmation, ConfirmationItem, ConfirmationDelivery
+from .models.invoices import Invoice, InvoiceItem
+from .models.staging import ImportStaging
+
+log = logging.getLogger(__name__)
+
+
+class Importer(ABC):
+    kind = None
+    model = None
+    model_item = None
+    document_form_class = forms.ModelForm
+    date_field = None
+
+    @staticmethod
+    def form_errors(form):
+        return '; '.join(f'{field}: {" ".join(errors)}' for field, errors in form.errors.items())
+
+    def document_data(self, supplier, name, document_date, orders=()):  # pylint: disable=W0613
+        return {
+            'name': name,
+            self.date_field: document_date.isoformat(),
+            'supplier': supplier.pk,
+            'comment': '',
+        }
+
+    def with_code(self, document, code):  # pylint: disable=W0613
+        return document
+
+    @abstractmethod
+    def stage_items(self, data_json, document_form):
+        pass
+
+    @abstractmethod
+    def save_document(self, document_form, data_json, plan):
+        pass
+
+    def validate(self, document):
+        document_form = self.document_form_class(data=document)
+        if not document_form.is_valid():
+            raise ValueError(self.form_errors(document_form))
+        return document_form
+
+    def stage(self, uploaded_file, parsed, document):
+        code, data = parsed
+        if data is None:
+            raise ValueError(f"No {self.kind} layout for supplier {document['supplier']}")
+        document = self.with_code(document, code)
+        document_form = self.validate(document)
+        data_json = json.loads(UploadFileForm.data_json(data))
+        plan = self.stage_items(data_json, document_form)
+        file_hash = UploadFileForm.file_hash(uploaded_file)
+        return {
+            'file': uploaded_file.name,
+            'document': document,
+            'date': document[self.date_field],
+            'items': len(plan['items']),
+            'unknown': sum(item['quantity'] for item in plan['items']
+                           if item.get('client_id') == "Unknown"),
+            'imported': UploadFileForm.imported_documents(self.model, file_hash),
+            'token': ImportStaging.stage(self.kind, data_json, plan, file_hash=file_hash),
+        }
+
+    def save(self, entry):
+        data_json, plan = ImportStaging.load(self.kind, entry['token'])
+        document_form = self.validate(entry['document'])
+        document_form.instance.file_hash = plan.get('file_hash', "")
+        document = self.save_document(document_form, data_json, plan)
+        ImportStaging.discard(entry['token'])
+        return document
+
+
+class OrderImporter(Importer):
+    kind = ImportStaging.Kind.ORDER
+    model = Order
+    model_item = OrderItem
+    document_form_class = OrderModelForm
+    date_field = 'order_date'
+
+    def stage_items(self, data_json, document_form):
+        return self.model_item.stage_order_items(data_json)
+
+    def save_document(self, document_form, data_json, plan):
+        order = document_form.save()
+        self.model_item.save_order_items(
+            order_data_json=data_json, order=order, plan=plan)
+        return order
+
+
+class ConfirmationImporter(Importer):
+    kind = ImportStaging.Kind.CONFIRMATION
+    model = Confirmation
+    model_item = ConfirmationItem
+    model_delivery = ConfirmationDelivery
+    document_form_class = ConfirmationModelForm
+    date_field = 'confirmation_date'
+
+    def document_data(self, supplier, name, document_date, orders=()):
+        return {
+            **super().document_data(supplier, name, document_date),
+            'order': list(orders),
+        }
+
+    def with_code(self, document, code):
+        return {**document, 'confirmation_code': code}
+
+    def stage_items(self, data_json, document_form):
+        return self.model_item.stage_confirmation_items(
+            data_json, list(document_form.cleaned_data['order']))
+
+    def save_document(self, document_form, data_json, plan):
+        confirmation = document_form.save(commit=False)
+        confirmation.save()
+        document_form.save_m2m()
+        self.model_item.save_confirmation_items(
+            confirmation_data_json=data_json, confirmation=confirmation, plan=plan)
+        self.model_delivery.save_confirmation_delivery(
+            confirmation_data_json=data_json, confirmation=confirmation)
+        return confirmation
+
+
+class InvoiceImporter(Importer):
+    kind = ImportStaging.Kind.INVOICE
+    model = Invoice
+    model_item = InvoiceItem
+    document_form_class = InvoiceModelForm
+    date_field = 'invoice_date'
+
+    def stage_items(self, data_json, document_form):
+        return self.model_item.stage_invoice_items(
+            data_json, document_form.cleaned_data['invoice_date'])
+
+    def save_document(self, document_form, data_json, plan):
+        invoice = document_form.save()
+        self.model_item.save_invoice_items(
+            invoice_data_json=data_json, invoice=invoice, plan=plan)
+        return invoice
+
+
+IMPORTERS = {
+    importer.kind: importer
+    for importer in (OrderImporter(), ConfirmationImporter(), InvoiceImporter())
+}
@@ -0,0 +1,45 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orderflow_app.backfill import Backfill, read_archive
+
+
+class Command(BaseCommand):
+    help = 'Load an archive of order, confirmation and invoice files in one pass'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Excel files or folders with Excel files, searched recursively')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Parse and allocate the files without saving anything')
+
+    @staticmethod
+    def files(paths):
+        for path in map(Path, paths):
+            if path.is_dir():
+                yield from sorted(path.rglob('*.xls*'))
+            elif path.is_file():
+                yield path
+            else:
+                raise CommandError(f'No such file or folder: {path}')
+
+    def handle(self, *args, **kwargs):
+        started = time.perf_counter()
+        documents, failed = read_archive(list(self.files(kwargs['paths'])))
+        self.stdout.write(
+            f'Parsed {len(documents)} files in {time.perf_counter() - started:.1f} s')
+        backfill = Backfill(documents)
+        not_allocated = backfill.allocate()
+        for file_name, error in failed + not_allocated:
+            self.stdout.write(f'{file_name}: {error}')
+        self.stdout.write(f'Allocated {len(documents) - len(not_allocated)} files, '
+                          f'failed {len(failed) + len(not_allocated)} files')
+        if kwargs['dry_run']:
+            return
+        for model, rows in backfill.write().items():
+            self.stdout.write(f'{model}: {rows} rows')
+        self.stdout.write(f'Finished in {time.perf_counter() - started:.1f} s')
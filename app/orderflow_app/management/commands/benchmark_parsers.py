@@ -0,0 +1,53 @@
+import time
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+
+from orderflow_app import parsers
+
+
+class Command(BaseCommand):
+    help = 'Time every registered supplier layout against sample files'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='+',
+            help='Excel files or folders with Excel files')
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help='How many times every file is parsed')
+
+    @staticmethod
+    def files(paths):
+        for path in map(Path, paths):
+            if path.is_dir():
+                yield from sorted(path.glob('*.xls*'))
+            elif path.is_file():
+                yield path
+            else:
+                raise CommandError(f'No such file or folder: {path}')
+
+    def handle(self, *args, **kwargs):
+        failed = 0
+        for path in self.files(kwargs['paths']):
+            content = path.read_bytes()
+            for file_parser in parsers.parsers_for(path.name):
+                timings = []
+                try:
+                    for _ in range(kwargs['repeat']):
+                        uploaded_file = SimpleUploadedFile(path.name, content)
+                        started = time.perf_counter()
+                        _, data = file_parser.parse(uploaded_file)
+                        timings.append(time.perf_counter() - started)
+                except Exception as e:  # pylint: disable=W0718
+                    failed += 1
+                    self.stdout.write(
+                        f'{path.name} | {file_parser.supplier_id} | {file_parser.layout.kind}: {e}')
+                    continue
+                self.stdout.write(
+                    f'{path.name} | {file_parser.supplier_id} | {file_parser.layout.kind}: '
+                    f'{len(data)} rows, best {min(timings) * 1000:.1f} ms, '
+                    f'mean {sum(timings) / len(timings) * 1000:.1f} ms')
+        if failed:
+            raise CommandError(f'{failed} files could not be parsed')
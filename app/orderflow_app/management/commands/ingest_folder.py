@@ -0,0 +1,142 @@
+import shutil
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from orderflow_app import parsers
+from orderflow_app.importers import IMPORTERS
+from orderflow_app.models.directories import Supplier
+from orderflow_app.models.orders import Order
+
+KINDS = (parsers.ORDER, parsers.CONFIRMATION, parsers.INVOICE)
+
+
+class Command(BaseCommand):
+    help = 'Import order, confirmation and invoice files dropped into a folder'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'folder',
+            help='Folder with Excel files named as in the upload forms')
+        parser.add_argument(
+            '--done',
+            help='Folder for imported files, FOLDER/done by default')
+        parser.add_argument(
+            '--failed',
+            help='Folder for files that could not be imported, FOLDER/failed by default')
+        parser.add_argument(
+            '--watch', action='store_true',
+            help='Keep watching the folder for new files')
+        parser.add_argument(
+            '--interval', type=int, default=10,
+            help='Seconds between scans of the folder in watch mode')
+
+    @staticmethod
+    def classify(paths):
+        groups = defaultdict(list)
+        unknown = []
+        for path in paths:
+            if file_parsers := parsers.parsers_for(path.name):
+                groups[file_parsers[0]].append(path)
+            else:
+                unknown.append(path)
+        return sorted(groups.items(), key=lambda group: KINDS.index(group[0].layout.kind)), unknown
+
+    @staticmethod
+    def move(path, folder):
+        folder.mkdir(parents=True, exist_ok=True)
+        destination = folder / path.name
+        if destination.exists():
+            destination = folder / f'{path.stem}-{time.strftime("%Y%m%d%H%M%S")}{path.suffix}'
+        shutil.move(path, destination)
+
+    @staticmethod
+    def import_file(file_parser, supplier, uploaded_file, parsed):
+        if isinstance(parsed, Exception):
+            raise parsed
+        importer = IMPORTERS[file_parser.layout.kind]
+        document_date = file_parser.document_date(uploaded_file.name)
+        if document_date is None:
+            raise ValueError("No date in file name")
+        orders = (Order.unconfirmed(supplier, document_date)
+                  if file_parser.layout.kind == parsers.CONFIRMATION else ())
+        document = importer.document_data(
+            supplier, uploaded_file.name, document_date, [order.pk for order in orders])
+        entry = importer.stage(uploaded_file, parsed, document)
+        with transaction.atomic():
+            saved = importer.save(entry)
+        return saved, entry['imported']
+
+    def report(self, path, kind, message):
+        self.stdout.write(f'{path.name} | {kind}: {message}')
+
+    @staticmethod
+    def parse_group(file_parser, supplier, uploaded_files):
+        try:
+            if supplier is None:
+                raise ValueError(f"No supplier {file_parser.supplier_id}")
+            return parsers.parse_files(uploaded_files, supplier, file_parser.layout.kind)
+        except Exception as e:  # pylint: disable=W0718
+            return [e] * len(uploaded_files)
+
+    def import_group(self, file_parser, paths, folders):
+        kind = file_parser.layout.kind
+        paths = sorted(paths, key=lambda path: (
+            str(file_parser.document_date(path.name)), path.name))
+        uploaded_files = [SimpleUploadedFile(path.name, path.read_bytes()) for path in paths]
+        supplier = Supplier.objects.filter(pk=file_parser.supplier_id).first()
+        imported = 0
+        for path, uploaded_file, parsed in zip(
+                paths, uploaded_files, self.parse_group(file_parser, supplier, uploaded_files)):
+            try:
+                document, previous = self.import_file(
+                    file_parser, supplier, uploaded_file, parsed)
+            except Exception as e:  # pylint: disable=W0718
+                self.report(path, kind, f'failed, {e}')
+                self.move(path, folders['failed'])
+                continue
+            note = f', already imported as {", ".join(previous)}' if previous else ''
+            self.report(path, kind, f'imported as {document.pk}{note}')
+            self.move(path, folders['done'])
+            imported += 1
+        return imported
+
+    def ingest(self, paths, folders):
+        groups, unknown = self.classify(paths)
+        for path in unknown:
+            self.report(path, 'unknown', 'failed, no layout matches the file name')
+            self.move(path, folders['failed'])
+        imported = sum(self.import_group(file_parser, group_paths, folders)
+                       for file_parser, group_paths in groups)
+        return imported, len(paths) - imported
+
+    @staticmethod
+    def scan(folder, settled_before=None):
+        return sorted(path for path in folder.glob('*.xls*') if path.is_file() and (
+            settled_before is None or path.stat().st_mtime < settled_before))
+
+    def handle(self, *args, **kwargs):
+        folder = Path(kwargs['folder'])
+        if not folder.is_dir():
+            raise CommandError(f'No such folder: {folder}')
+        folders = {
+            'done': Path(kwargs['done'] or folder / 'done'),
+            'failed': Path(kwargs['failed'] or folder / 'failed'),
+        }
+        if not kwargs['watch']:
+            imported, failed = self.ingest(self.scan(folder), folders)
+            self.stdout.write(f'Imported {imported} files, failed {failed} files')
+            return
+        self.stdout.write(f'Watching {folder}')
+        try:
+            while True:
+                if paths := self.scan(folder, time.time() - kwargs['interval']):
+                    imported, failed = self.ingest(paths, folders)
+                    self.stdout.write(f'Imported {imported} files, failed {failed} files')
+                time.sleep(kwargs['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write('Stopped watching')
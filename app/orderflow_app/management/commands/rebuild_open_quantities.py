@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orderflow_app.models.openquantities import OpenQuantity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild open quantities from confirmation, invoice and cancellation items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only verify open quantities, do not rebuild them')
+
+    def handle(self, *args, **kwargs):
+        if not kwargs['check']:
+            self.stdout.write('Started rebuilding open quantities')
+            OpenQuantity.rebuild()
+            self.stdout.write('Finished rebuilding open quantities')
+        differences = OpenQuantity.verify()
+        for key, (actual, expected) in sorted(differences.items(), key=str):
+            self.stdout.write(
+                f'{" | ".join(str(x) for x in key)}: {actual} instead of {expected}')
+        if differences:
+            raise CommandError(
+                f'{len(differences)} open quantities differ from items')
+        self.stdout.write('Open quantities match items')
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:45
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+KEY_FIELDS = ("product_id", "client_id", "order_id", "confirmation_id")
+
+
+def fill_open_quantities(apps, schema_editor):
+    OpenQuantity = apps.get_model("orderflow_app", "OpenQuantity")
+    open_quantities = defaultdict(int)
+    for model_name, sign in (("ConfirmationItem", 1), ("InvoiceItem", -1), ("CancellationItem", -1)):
+        model = apps.get_model("orderflow_app", model_name)
+        quantity_per_key = model.objects.values(
+            *KEY_FIELDS).annotate(quantity=models.Sum("quantity")).order_by()
+        for item in quantity_per_key:
+            key = tuple(item[field] for field in KEY_FIELDS)
+            open_quantities[key] += sign * item["quantity"]
+    OpenQuantity.objects.bulk_create(
+        OpenQuantity(**dict(zip(KEY_FIELDS, key)), quantity=quantity)
+        for key, quantity in open_quantities.items() if quantity)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderflow_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenQuantity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_quantities', to='orderflow_app.client')),
+                ('confirmation', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='open_quantities', to='orderflow_app.confirmation')),
+                ('order', models.ForeignKey(default=None, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='open_quantities', to='orderflow_app.order')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_quantities', to='orderflow_app.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'client', 'order', 'confirmation'), name='unique_open_quantity_key', nulls_distinct=False)],
+            },
+        ),
+        migrations.RunPython(fill_open_quantities,
+                             migrations.RunPython.noop),
+    ]
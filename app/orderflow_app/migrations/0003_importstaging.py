@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:11
+
+import orderflow_app.models.staging
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderflow_app', '0002_openquantity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportStaging',
+            fields=[
+                ('token', models.CharField(default=orderflow_app.models.staging.new_token, max_length=32, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('confirmation', 'Confirmation'), ('invoice', 'Invoice')], max_length=20)),
+                ('payload', models.BinaryField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
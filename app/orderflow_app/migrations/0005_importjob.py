@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:35
+
+import django.db.models.deletion
+import orderflow_app.models.staging
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orderflow_app', '0004_document_file_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.CharField(default=orderflow_app.models.staging.new_token, max_length=32, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('order', 'Order'), ('confirmation', 'Confirmation'), ('invoice', 'Invoice')], max_length=20)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('message', models.TextField(blank=True, default='')),
+                ('file_name', models.CharField(max_length=450)),
+                ('content', models.BinaryField()),
+                ('document', models.JSONField(default=dict)),
+                ('result', models.CharField(blank=True, default='', max_length=450)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to='orderflow_app.supplier')),
+            ],
+        ),
+    ]
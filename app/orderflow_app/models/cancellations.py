@@ -1,12 +1,12 @@
 import logging
 from datetime import datetime
-from itertools import groupby
 
-from django.db import models
+from django.db import models, transaction
 
+from ..allocation import allocate
 from .directories import Supplier, Product, Client, Brand
 from .orders import Order
-from .confirmations import Confirmation, ConfirmationItem
+from .confirmations import Confirmation
 
 
 log = logging.getLogger(__name__)
@@ -36,63 +36,49 @@ class CancellationItem(models.Model):
     quantity = models.PositiveIntegerField()
 
     @classmethod
-    def save_cancellation_items(cls, cancellation_data, cancellation):  # pylint: disable=R0914
-        from .report import get_left_quantity_per_client
-        from .invoices import InvoiceItem  # pylint: disable=R0401
-        filtered_data = [
-            item for item in cancellation_data if item['product'] != ""]
-        sorted_data = sorted(filtered_data,
-                             key=lambda x: x['product'])
-        grouped = groupby(sorted_data, key=lambda x: x['product'])
-        for product_id, group in grouped:
-            items = list(group)
-            if items[0].get('quantity'):
-                total_quantity = sum(int(item.get('quantity'))
-                                     for item in items)
+    def plan_cancellation_items(cls, cancellation_data, cancellation_date):  # pylint: disable=R0914
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
+        quantities = {}
+        for item in cancellation_data:
+            if item.get('product', "") == "":
+                continue
+            key = (item['product'], item.get('confirmation'))
+            quantity = item.get('quantity')
+            if quantity is None or (key in quantities and quantities[key] is None):
+                quantities[key] = None
             else:
-                total_quantity = 0
-            product_id = items[0].get('product')
-            for item in items:
-                confirmation_id = item.get("confirmation")
-                confirmation = ({'confirmation_id': confirmation_id}
-                                if confirmation_id is not None else {})
-                confirmed_items = ConfirmationItem.objects.filter(
-                    product_id=product_id,
-                    **confirmation,
-                    confirmation__confirmation_date__lte=cancellation.cancellation_date)\
-                    .select_related("confirmation", "order")\
-                    .order_by(
-                        "order__order_date",
-                        "confirmation__confirmation_date",
-                )
-                invoiced_items = InvoiceItem.objects.filter(
-                    **confirmation,
-                    product_id=product_id,
-                )
-                cancelled_items = CancellationItem.objects.filter(
-                    **confirmation,
-                    cancellation=cancellation,
-                    product_id=product_id,
-                )
-                left_quantity_per_client = get_left_quantity_per_client(
-                    product_id, confirmed_items, invoiced_items, cancelled_items)
-                if left_quantity_per_client:
-                    i = 0
-                    while i < len(left_quantity_per_client) and total_quantity > 0:
-                        item = left_quantity_per_client[i]
-                        i += 1
-                        if total_quantity < item['quantity']:
-                            quantity = total_quantity
-                        else:
-                            quantity = item['quantity']
-                        total_quantity -= quantity
-                        new_object = cls.objects.create(
-                            cancellation_id=cancellation.id,
-                            client_id=item['client_id'],
-                            product_id=product_id,
-                            confirmation_id=item['confirmation_id'],
-                            order_id=item['order_id'],
-                            quantity=quantity,)
-            if total_quantity > 0:
+                quantities[key] = quantities.get(key, 0) + int(quantity)
+        balances = OpenQuantity.open_balances(
+            {product_id for product_id, _ in quantities}, cancellation_date, net_positive=False)
+        items = []
+        for (product_id, confirmation_id), quantity in sorted(
+                quantities.items(), key=lambda x: (x[0][0], x[0][1] or "")):
+            product_balances = [
+                balance for balance in balances.get(product_id, [])
+                if confirmation_id in (None, balance['confirmation_id'])
+                and balance['quantity'] > 0]
+            if quantity is None:
+                quantity = sum(balance['quantity']
+                               for balance in product_balances)
+            allocations, quantity = allocate(quantity, product_balances)
+            if quantity > 0:
                 raise ValueError(
-                    f"For product {product_id} quantity for cancellation is {total_quantity} pieces more than left")
+                    f"For product {product_id} quantity for cancellation is {quantity} pieces more than left")
+            for balance, allocation in zip(product_balances, allocations):
+                balance['quantity'] -= allocation['quantity']
+            items += [{'product_id': product_id, **allocation}
+                      for allocation in allocations]
+        return items
+
+    @classmethod
+    def save_cancellation_items(cls, cancellation_data, cancellation):
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
+        with transaction.atomic():
+            OpenQuantity.lock_products(
+                item['product'] for item in cancellation_data if item.get('product', "") != "")
+            items = cls.plan_cancellation_items(
+                cancellation_data, cancellation.cancellation_date)
+            cancellation_items = cls.objects.bulk_create(
+                cls(cancellation_id=cancellation.id, **item) for item in items)
+            OpenQuantity.apply(OpenQuantity.deltas(cancellation_items, -1))
+        return cancellation_items
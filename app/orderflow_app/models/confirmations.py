@@ -1,16 +1,26 @@
 import logging
+from collections import defaultdict
 from itertools import groupby
 from datetime import datetime
 
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
 
+from ..allocation import allocate, left_quantities
 from .directories import Supplier, Client, Product
 from .orders import Order, OrderItem
+from .querysets import TotalsQuerySet, ItemQuerySet, amount
 
 log = logging.getLogger(__name__)
 
 
+class ConfirmationQuerySet(TotalsQuerySet):
+    totals = {
+        'items_amount': amount('items'),
+        'open_quantity': 'open_quantities__quantity',
+    }
+
+
 class Confirmation(models.Model):
     id = models.CharField(primary_key=True, null=False, max_length=100)
     name = models.CharField(max_length=250)
@@ -22,9 +32,15 @@ class Confirmation(models.Model):
         "Order", related_name="confirmations", null=True, default=None)
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
+    file_hash = models.CharField(
+        max_length=64, blank=True, default="", db_index=True, editable=False)
+
+    objects = ConfirmationQuerySet.as_manager()
 
     @property
     def total_amount(self):
+        if (items_amount := getattr(self, 'items_amount', None)) is not None:
+            return items_amount
         return sum(item.total_amount for item in self.items.all())
 
     class Meta:
@@ -51,98 +67,153 @@ class ConfirmationItem(models.Model):
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
 
+    objects = ItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ("confirmation", "client", "product", "order")
 
     @property
     def total_amount(self):
+        if (item_amount := getattr(self, 'amount', None)) is not None:
+            return item_amount
         if self.price and self.quantity:
             return self.price * self.quantity
         return 0
 
     @staticmethod
-    def get_left_quantity_per_client(ordered_items, confirmed_items):
-        ordered_quantity_per_client = ordered_items.values('client_id').annotate(
-            quantity=models.Sum('quantity')
-        ).order_by('client_id')
-        confirmed_quantity_per_client = confirmed_items.values('client_id').annotate(
-            quantity=models.Sum('quantity')
-        ).order_by('client_id')
-        ordered_quantity = ordered_quantity_per_client.aggregate(
-            total=models.Sum("quantity", default=0))['total']
-        confirmed_quantity = confirmed_quantity_per_client.aggregate(
-            total=models.Sum("quantity", default=0))['total']
-        left_quantity_per_client = []
-        if ordered_quantity-confirmed_quantity > 0:
-            for ordered_item in ordered_quantity_per_client:
-                total_confirmed = sum(confirmed_item.get('quantity') for confirmed_item in confirmed_quantity_per_client
-                                      if confirmed_item.get('client_id') == ordered_item.get('client_id'))
-                left_quantity = ordered_item["quantity"] - total_confirmed
-                if left_quantity > 0:
-                    left_quantity_per_client.append(
-                        {"client_id": ordered_item["client_id"], "quantity": left_quantity})
-        return left_quantity_per_client
+    def quantity_per_order_product(items):
+        result = defaultdict(list)
+        for item in items.values('order_id', 'product_id', 'client_id').annotate(
+                quantity=models.Sum('quantity')).order_by('client_id'):
+            result[(item['order_id'], item['product_id'])].append(item)
+        return result
+
+    @classmethod
+    def order_quantities(cls, orders, product_ids):
+        ordered_quantity = cls.quantity_per_order_product(OrderItem.objects.filter(
+            order__in=orders, product_id__in=product_ids))
+        confirmed_quantity = cls.quantity_per_order_product(ConfirmationItem.objects.filter(
+            order__in=orders, product_id__in=product_ids))
+        return ordered_quantity, confirmed_quantity
 
     @classmethod
-    def save_confirmation_items(cls, confirmation_data_json, confirmation):  # pylint: disable=R0914
+    def plan_confirmation_items(cls, confirmation_data_json, orders,  # pylint: disable=R0914
+                                order_quantities=None):
         filtered_data = [
             item for item in confirmation_data_json if item['product'] != ""]
-
         sorted_data = sorted(filtered_data,
                              key=lambda x: x['product'])
-        grouped = groupby(sorted_data, key=lambda x: x['product'])
+        grouped = [(product_id, list(group)) for product_id, group in groupby(
+            sorted_data, key=lambda x: x['product'])]
+        product_ids = [product_id for product_id, _ in grouped]
+        ordered_quantity, confirmed_quantity = (
+            order_quantities or cls.order_quantities)(orders, product_ids)
+        products = []
+        items = []
         for product_id, group in grouped:
-            items = list(group)
-            total_quantity = sum(int(item['quantity']) for item in items)
-            product_id = items[0].get("product")
-            brand_id = product_id.split("_")[1]
-            product_name = items[0].get("product_name")
-            defaults = {
-                'name': product_name,
-                'brand_id': brand_id
-
-            }
-            product, created = Product.objects.update_or_create(
-                id=product_id, defaults=defaults)
-            price = items[0].get("price")
-            orders = confirmation.order.all()
+            total_quantity = sum(int(item['quantity']) for item in group)
+            price = group[0].get("price")
+            products.append({
+                'id': product_id,
+                'name': group[0].get("product_name"),
+                'brand_id': product_id.split("_")[1],
+            })
             for order in orders:
-                ordered_items = OrderItem.objects.filter(
-                    order=order,
-                    product=product,
-                ).select_related('order')
-                confirmed_items = ConfirmationItem.objects.filter(
-                    order=order,
-                    product=product,
-                ).select_related('order')
-                left_quantity_per_client = cls.get_left_quantity_per_client(ordered_items,
-                                                                            confirmed_items)
-                if left_quantity_per_client:
-                    i = 0
-                    while i < len(left_quantity_per_client) and total_quantity > 0:
-                        item = left_quantity_per_client[i]
-                        i += 1
-                        client_id = item['client_id']
-                        if total_quantity < item['quantity']:
-                            quantity = total_quantity
-                        else:
-                            quantity = item['quantity']
-                        total_quantity -= quantity
-                        cls.objects.create(
-                            confirmation_id=confirmation.id,
-                            client_id=client_id,
-                            product_id=product.id,
-                            order_id=order.id,
-                            quantity=quantity,
-                            price=price)
+                left_quantity_per_client = left_quantities(
+                    ordered_quantity[(order.id, product_id)],
+                    [confirmed_quantity[(order.id, product_id)]],
+                    key_fields=("client_id",))
+                allocations, total_quantity = allocate(
+                    total_quantity, left_quantity_per_client)
+                items += [{
+                    'client_id': item['client_id'],
+                    'product_id': product_id,
+                    'order_id': order.id,
+                    'quantity': item['quantity'],
+                    'price': price,
+                } for item in allocations]
             if total_quantity > 0:
-                client, _ = Client.objects.get_or_create(id="Unknown")
-                cls.objects.create(
-                    confirmation_id=confirmation.id,
-                    client_id=client.id,
-                    product_id=product_id,
-                    quantity=total_quantity,
-                    price=price,)
+                items.append({
+                    'client_id': "Unknown",
+                    'product_id': product_id,
+                    'order_id': None,
+                    'quantity': total_quantity,
+                    'price': price,
+                })
+        return products, items
+
+    @staticmethod
+    def plan_stamp(product_ids, orders):
+        from .openquantities import OpenQuantity, stamp  # pylint: disable=R0401
+        return stamp(
+            OpenQuantity.objects.filter(product_id__in=product_ids),
+            OrderItem.objects.filter(
+                order__in=orders, product_id__in=product_ids),
+        )
+
+    @classmethod
+    def stage_confirmation_items(cls, confirmation_data_json, orders):
+        plan_stamp = cls.plan_stamp(
+            {item['product'] for item in confirmation_data_json if item['product'] != ""}, orders)
+        products, items = cls.plan_confirmation_items(
+            confirmation_data_json, orders)
+        return {
+            'orders': sorted(order.id for order in orders),
+            'stamp': plan_stamp,
+            'products': products,
+            'items': items,
+        }
+
+    @classmethod
+    def save_confirmation_items(cls, confirmation_data_json, confirmation, plan=None):
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
+        with transaction.atomic():
+            product_ids = {item['product']
+                           for item in confirmation_data_json if item['product'] != ""}
+            OpenQuantity.lock_products(product_ids)
+            orders = list(confirmation.order.all())
+            if plan is not None and (plan['orders'] != sorted(order.id for order in orders)
+                                     or plan['stamp'] != cls.plan_stamp(product_ids, orders)):
+                log.info(
+                    "Staged plan for confirmation %s is outdated, allocating again", confirmation.id)
+                plan = None
+            if plan is None:
+                products, items = cls.plan_confirmation_items(
+                    confirmation_data_json, orders)
+            else:
+                products, items = plan['products'], plan['items']
+            Product.register_products(
+                products, update_fields=['name', 'brand_id'])
+            if any(item['client_id'] == "Unknown" for item in items):
+                Client.objects.get_or_create(id="Unknown")
+            confirmation_items = cls.objects.bulk_create(
+                cls(confirmation_id=confirmation.id, **item) for item in items)
+            OpenQuantity.apply(OpenQuantity.deltas(confirmation_items))
+        return confirmation_items
+
+    @classmethod
+    def reallocate_orders(cls, confirmation, removed_order_ids, added_order_ids):
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
+        with transaction.atomic():
+            released_items = confirmation.items.filter(
+                models.Q(order_id__in=removed_order_ids) | models.Q(order__isnull=True))
+            confirmation_data_json = list(released_items.values('product').annotate(
+                quantity=models.Sum('quantity'),
+                price=models.Max('price'),
+            ).order_by('product'))
+            if not confirmation_data_json:
+                return []
+            OpenQuantity.lock_products(
+                item['product'] for item in confirmation_data_json)
+            _, items = cls.plan_confirmation_items(
+                confirmation_data_json, list(confirmation.order.filter(pk__in=added_order_ids)))
+            released_items.delete()
+            if any(item['client_id'] == "Unknown" for item in items):
+                Client.objects.get_or_create(id="Unknown")
+            confirmation_items = cls.objects.bulk_create(
+                cls(confirmation_id=confirmation.id, **item) for item in items)
+            OpenQuantity.apply(OpenQuantity.deltas(confirmation_items))
+        return confirmation_items
 
 
 class ConfirmationDelivery(models.Model):
@@ -156,8 +227,8 @@ class ConfirmationDelivery(models.Model):
     class Meta:
         unique_together = ("confirmation", "product", "delivery_date")
 
-    @classmethod
-    def save_confirmation_delivery(cls, confirmation_data_json, confirmation):
+    @staticmethod
+    def plan_confirmation_delivery(confirmation_data_json):
         filtered_data = [
             item for item in confirmation_data_json if item['product'] != "" and
             item['delivery_date'] != "" and item['delivery_date'] != "None"]
@@ -166,6 +237,7 @@ class ConfirmationDelivery(models.Model):
         grouped = groupby(
             sorted_data,
             key=lambda x: (x['product'], x['delivery_date']))
+        delivery_items = []
         for (product_item, delivery_date), group in grouped:
             items = list(group)
             product, delivery = (product_item, delivery_date)
@@ -175,5 +247,11 @@ class ConfirmationDelivery(models.Model):
             except Exception as e:  # pylint: disable=W0718
                 delivery_date = None
             quantity = sum(int(item['quantity']) for item in items)
-            cls.objects.create(
-                confirmation_id=confirmation.id, product_id=product, delivery_date=delivery_date, quantity=quantity)
+            delivery_items.append(
+                {'product_id': product, 'delivery_date': delivery_date, 'quantity': quantity})
+        return delivery_items
+
+    @classmethod
+    def save_confirmation_delivery(cls, confirmation_data_json, confirmation):
+        for item in cls.plan_confirmation_delivery(confirmation_data_json):
+            cls.objects.create(confirmation_id=confirmation.id, **item)
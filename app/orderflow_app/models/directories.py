@@ -1,7 +1,9 @@
 from datetime import date
 
 from django.db import models
-from django.dispatch import receiver
+from django.dispatch import Signal, receiver
+
+post_bulk_save = Signal()
 
 
 class Client(models.Model):
@@ -53,6 +55,27 @@ class Product(models.Model):
     def __str__(self):
         return self.id
 
+    @classmethod
+    def register_products(cls, products, update_fields=()):
+        products = {product['id']: product for product in products}
+        registry = cls.objects.in_bulk(products.keys())
+        changed = [
+            cls(**product) for product_id, product in products.items()
+            if product_id not in registry or any(
+                getattr(registry[product_id], field) != product.get(field)
+                for field in update_fields)
+        ]
+        if not changed:
+            return registry
+        written = cls.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['id'],
+            update_fields=list(update_fields) or ['brand_id'])
+        registry.update((product.id, product) for product in written)
+        if missing := products.keys() - registry.keys():
+            raise ValueError(f"Products are not registered: {', '.join(sorted(missing))}")
+        post_bulk_save.send(sender=cls, instances=written)
+        return registry
+
 
 @receiver(models.signals.pre_save, sender=Product)
 def set_id(sender, instance, **kwargs):
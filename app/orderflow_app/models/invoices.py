@@ -2,18 +2,25 @@ import logging
 from datetime import datetime
 from itertools import groupby
 
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
 
+from ..allocation import allocate
 from .directories import Supplier, Product, Client
-from .confirmations import Confirmation, ConfirmationItem
+from .confirmations import Confirmation
 from .orders import Order
-from .cancellations import CancellationItem
+from .querysets import TotalsQuerySet, ItemQuerySet, amount
 
 
 log = logging.getLogger(__name__)
 
 
+class InvoiceQuerySet(TotalsQuerySet):
+    totals = {
+        'items_amount': amount('items'),
+    }
+
+
 class Invoice(models.Model):
     id = models.CharField(primary_key=True, null=False, max_length=450)
     name = models.CharField(max_length=250)
@@ -22,9 +29,15 @@ class Invoice(models.Model):
         Supplier, on_delete=models.CASCADE, related_name="invoices")
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
+    file_hash = models.CharField(
+        max_length=64, blank=True, default="", db_index=True, editable=False)
+
+    objects = InvoiceQuerySet.as_manager()
 
     @property
     def total_amount(self):
+        if (items_amount := getattr(self, 'items_amount', None)) is not None:
+            return items_amount
         return sum(item.total_amount for item in self.items.all())
 
     class Meta:
@@ -61,78 +74,101 @@ class InvoiceItem(models.Model):
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
 
+    objects = ItemQuerySet.as_manager()
+
     class Meta:
         unique_together = ("invoice", "client", "product",
                            "confirmation", "order")
 
     @property
     def total_amount(self):
+        if (item_amount := getattr(self, 'amount', None)) is not None:
+            return item_amount
         if self.price and self.quantity:
             return self.price * self.quantity
         return 0
 
     @classmethod
-    def save_invoice_items(cls, invoice_data_json, invoice):  # pylint: disable=R0914
-        from .report import get_left_quantity_per_client
+    def plan_invoice_items(cls, invoice_data_json, invoice_date, open_balances=None):  # pylint: disable=R0914
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
         filtered_data = [
             item for item in invoice_data_json if item['product'] != ""]
-
         sorted_data = sorted(filtered_data,
                              key=lambda x: x['product'])
-        grouped = groupby(sorted_data, key=lambda x: x['product'])
+        grouped = [(product_id, list(group)) for product_id, group in groupby(
+            sorted_data, key=lambda x: x['product'])]
+        balances = (open_balances or OpenQuantity.open_balances)(
+            [product_id for product_id, _ in grouped], invoice_date)
+        products = []
+        items = []
         for product_id, group in grouped:
-            items = list(group)
-            total_quantity = sum(int(item['quantity']) for item in items)
-            product_id = items[0].get("product")
-            brand_id = product_id.split("_")[1]
-            product_name = items[0].get("product_name")
-            defaults = {
-                'name': product_name,
-                'brand_id': brand_id
-
-            }
-            product, created = Product.objects.get_or_create(
-                id=product_id, defaults=defaults)
-            price = items[0].get("price")
-            confirmed_items = ConfirmationItem.objects.filter(
-                product_id=product_id,
-                confirmation__confirmation_date__lte=invoice.invoice_date)\
-                .select_related("confirmation", "order")\
-                .order_by(
-                    "order__order_date",
-                    "confirmation__confirmation_date",
-            )
-            invoiced_items = InvoiceItem.objects.filter(
-                product_id=product_id,
-            )
-            cancelled_items = CancellationItem.objects.filter(
-                product_id=product_id,
-            )
-            left_quantity_per_client = get_left_quantity_per_client(product_id,
-                                                                    confirmed_items, invoiced_items, cancelled_items)
-            if left_quantity_per_client:
-                i = 0
-                while i < len(left_quantity_per_client) and total_quantity > 0:
-                    item = left_quantity_per_client[i]
-                    i += 1
-                    if total_quantity < item['quantity']:
-                        quantity = total_quantity
-                    else:
-                        quantity = item['quantity']
-                    total_quantity -= quantity
-                    cls.objects.create(
-                        invoice_id=invoice.id,
-                        client_id=item['client_id'],
-                        product_id=product.id,
-                        confirmation_id=item['confirmation_id'],
-                        order_id=item['order_id'],
-                        quantity=quantity,
-                        price=price)
+            total_quantity = sum(int(item['quantity']) for item in group)
+            price = group[0].get("price")
+            products.append({
+                'id': product_id,
+                'name': group[0].get("product_name"),
+                'brand_id': product_id.split("_")[1],
+            })
+            allocations, total_quantity = allocate(
+                total_quantity, balances.get(product_id, []))
+            items += [{
+                'client_id': item['client_id'],
+                'product_id': product_id,
+                'confirmation_id': item['confirmation_id'],
+                'order_id': item['order_id'],
+                'quantity': item['quantity'],
+                'price': price,
+            } for item in allocations]
             if total_quantity > 0:
-                client, _ = Client.objects.get_or_create(id="Unknown")
-                cls.objects.create(
-                    invoice_id=invoice.id,
-                    client_id=client.id,
-                    product_id=product_id,
-                    quantity=total_quantity,
-                    price=price,)
+                items.append({
+                    'client_id': "Unknown",
+                    'product_id': product_id,
+                    'confirmation_id': None,
+                    'order_id': None,
+                    'quantity': total_quantity,
+                    'price': price,
+                })
+        return products, items
+
+    @staticmethod
+    def plan_stamp(product_ids):
+        from .openquantities import OpenQuantity, stamp  # pylint: disable=R0401
+        return stamp(OpenQuantity.objects.filter(product_id__in=product_ids))
+
+    @classmethod
+    def stage_invoice_items(cls, invoice_data_json, invoice_date):
+        plan_stamp = cls.plan_stamp(
+            {item['product'] for item in invoice_data_json if item['product'] != ""})
+        products, items = cls.plan_invoice_items(
+            invoice_data_json, invoice_date)
+        return {
+            'invoice_date': str(invoice_date),
+            'stamp': plan_stamp,
+            'products': products,
+            'items': items,
+        }
+
+    @classmethod
+    def save_invoice_items(cls, invoice_data_json, invoice, plan=None):
+        from .openquantities import OpenQuantity  # pylint: disable=R0401
+        with transaction.atomic():
+            product_ids = {item['product']
+                           for item in invoice_data_json if item['product'] != ""}
+            OpenQuantity.lock_products(product_ids)
+            if plan is not None and (plan['invoice_date'] != str(invoice.invoice_date)
+                                     or plan['stamp'] != cls.plan_stamp(product_ids)):
+                log.info(
+                    "Staged plan for invoice %s is outdated, allocating again", invoice.id)
+                plan = None
+            if plan is None:
+                products, items = cls.plan_invoice_items(
+                    invoice_data_json, invoice.invoice_date)
+            else:
+                products, items = plan['products'], plan['items']
+            Product.register_products(products)
+            if any(item['client_id'] == "Unknown" for item in items):
+                Client.objects.get_or_create(id="Unknown")
+            invoice_items = cls.objects.bulk_create(
+                cls(invoice_id=invoice.id, **item) for item in items)
+            OpenQuantity.apply(OpenQuantity.deltas(invoice_items, -1))
+        return invoice_items
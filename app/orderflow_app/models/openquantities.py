@@ -0,0 +1,207 @@
+import hashlib
+import logging
+from collections import defaultdict
+
+from django.db import connection, models, transaction
+from django.dispatch import receiver
+
+from ..allocation import BALANCE_KEY
+from .directories import Client, Product
+from .orders import Order
+from .confirmations import Confirmation, ConfirmationItem
+from .invoices import InvoiceItem
+from .cancellations import CancellationItem
+
+log = logging.getLogger(__name__)
+
+KEY_FIELDS = ("product_id", "client_id", "order_id", "confirmation_id")
+
+ITEM_SIGNS = {
+    ConfirmationItem: 1,
+    InvoiceItem: -1,
+    CancellationItem: -1,
+}
+
+
+def stamp(*querysets):
+    digest = hashlib.sha256()
+    for queryset in querysets:
+        digest.update(repr(list(queryset.order_by(
+            "id").values_list("id", "quantity"))).encode())
+    return digest.hexdigest()
+
+
+class OpenQuantity(models.Model):
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="open_quantities")
+    client = models.ForeignKey(
+        Client, on_delete=models.CASCADE, related_name="open_quantities")
+    order = models.ForeignKey(
+        Order, on_delete=models.CASCADE, related_name="open_quantities", null=True, default=None)
+    confirmation = models.ForeignKey(
+        Confirmation, on_delete=models.CASCADE, related_name="open_quantities", null=True, default=None)
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "client", "order", "confirmation"],
+                name="unique_open_quantity_key",
+                nulls_distinct=False,
+            ),
+        ]
+
+    @property
+    def key(self):
+        return tuple(getattr(self, field) for field in KEY_FIELDS)
+
+    @staticmethod
+    def item_key(item):
+        if isinstance(item, dict):
+            return tuple(item.get(field) for field in KEY_FIELDS)
+        return tuple(getattr(item, field) for field in KEY_FIELDS)
+
+    @classmethod
+    def deltas(cls, items, sign=1):
+        result = defaultdict(int)
+        for item in items:
+            quantity = item.get("quantity") if isinstance(
+                item, dict) else item.quantity
+            result[cls.item_key(item)] += sign * int(quantity)
+        return result
+
+    @staticmethod
+    def lock_products(product_ids):
+        product_ids = sorted(set(product_ids))
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_xact_lock(hashtext('open_quantity:' || product_id)) "
+                "FROM unnest(%s::varchar[]) AS product_id ORDER BY product_id",
+                [product_ids],
+            )
+
+    @classmethod
+    def apply(cls, deltas, create=True):
+        deltas = {key: quantity for key, quantity in deltas.items()
+                  if quantity}
+        if not deltas:
+            return
+        with transaction.atomic():
+            cls.lock_products(key[0] for key in deltas)
+            existing = {open_quantity.key: open_quantity
+                        for open_quantity in cls.objects.filter(
+                            product_id__in={key[0] for key in deltas})}
+            to_update = []
+            to_create = []
+            for key, quantity in deltas.items():
+                if open_quantity := existing.get(key):
+                    open_quantity.quantity += quantity
+                    to_update.append(open_quantity)
+                elif create:
+                    to_create.append(
+                        cls(**dict(zip(KEY_FIELDS, key)), quantity=quantity))
+            cls.objects.bulk_update(to_update, ["quantity"])
+            cls.objects.bulk_create(to_create)
+
+    @classmethod
+    def open_balances(cls, product_ids, confirmation_date, net_positive=True):
+        open_quantities = cls.objects.filter(
+            models.Q(confirmation__isnull=True) |
+            models.Q(confirmation__confirmation_date__lte=confirmation_date),
+            product_id__in=product_ids,
+        ).values(
+            "product_id", *BALANCE_KEY, "quantity"
+        ).order_by(
+            "order__order_date",
+            "confirmation__confirmation_date",
+            "id",
+        )
+        product_quantity = defaultdict(int)
+        balances = defaultdict(list)
+        for open_quantity in open_quantities:
+            product_id = open_quantity.pop("product_id")
+            product_quantity[product_id] += open_quantity["quantity"]
+            if open_quantity["confirmation_id"] and open_quantity["quantity"] > 0:
+                balances[product_id].append(open_quantity)
+        return {product_id: balances[product_id]
+                for product_id, quantity in product_quantity.items()
+                if quantity > 0 or not net_positive}
+
+    @classmethod
+    def compute(cls, product_ids=None):
+        product_filter = ({"product_id__in": product_ids}
+                          if product_ids is not None else {})
+        result = defaultdict(int)
+        for model, sign in ITEM_SIGNS.items():
+            quantity_per_key = model.objects.filter(**product_filter).values(
+                *KEY_FIELDS).annotate(quantity=models.Sum("quantity")).order_by()
+            for item in quantity_per_key:
+                result[cls.item_key(item)] += sign * item["quantity"]
+        return {key: quantity for key, quantity in result.items() if quantity}
+
+    @classmethod
+    def rebuild(cls, product_ids=None):
+        product_filter = ({"product_id__in": product_ids}
+                          if product_ids is not None else {})
+        with transaction.atomic():
+            if product_ids is not None:
+                cls.lock_products(product_ids)
+            cls.objects.filter(**product_filter).delete()
+            cls.objects.bulk_create(
+                cls(**dict(zip(KEY_FIELDS, key)), quantity=quantity)
+                for key, quantity in cls.compute(product_ids).items())
+
+    @classmethod
+    def verify(cls):
+        expected = cls.compute()
+        actual = {open_quantity.key: open_quantity.quantity
+                  for open_quantity in cls.objects.exclude(quantity=0)}
+        return {key: (actual.get(key, 0), expected.get(key, 0))
+                for key in expected.keys() | actual.keys()
+                if actual.get(key, 0) != expected.get(key, 0)}
+
+
+@receiver(models.signals.pre_save, sender=ConfirmationItem)
+@receiver(models.signals.pre_save, sender=InvoiceItem)
+@receiver(models.signals.pre_save, sender=CancellationItem)
+def keep_saved_item(sender, instance, **kwargs):
+    instance.saved_item = None
+    if instance.pk:
+        instance.saved_item = sender.objects.filter(
+            pk=instance.pk).values(*KEY_FIELDS, "quantity").first()
+
+
+@receiver(models.signals.post_save, sender=ConfirmationItem)
+@receiver(models.signals.post_save, sender=InvoiceItem)
+@receiver(models.signals.post_save, sender=CancellationItem)
+def update_open_quantity_on_save(sender, instance, **kwargs):
+    sign = ITEM_SIGNS[sender]
+    deltas = OpenQuantity.deltas([instance], sign)
+    if saved_item := getattr(instance, "saved_item", None):
+        for key, quantity in OpenQuantity.deltas([saved_item], -sign).items():
+            deltas[key] += quantity
+    OpenQuantity.apply(deltas)
+
+
+@receiver(models.signals.post_delete, sender=ConfirmationItem)
+@receiver(models.signals.post_delete, sender=InvoiceItem)
+@receiver(models.signals.post_delete, sender=CancellationItem)
+def update_open_quantity_on_delete(sender, instance, **kwargs):
+    OpenQuantity.apply(OpenQuantity.deltas(
+        [instance], -ITEM_SIGNS[sender]), create=False)
+
+
+@receiver(models.signals.pre_delete, sender=Order)
+@receiver(models.signals.pre_delete, sender=Confirmation)
+def keep_invoiced_products(sender, instance, **kwargs):
+    instance.invoiced_products = list(instance.invoiced_items.values_list(
+        "product_id", flat=True).distinct())
+
+
+@receiver(models.signals.post_delete, sender=Order)
+@receiver(models.signals.post_delete, sender=Confirmation)
+def rebuild_invoiced_products(sender, instance, **kwargs):
+    if invoiced_products := getattr(instance, "invoiced_products", None):
+        OpenQuantity.rebuild(invoiced_products)
@@ -1,7 +1,19 @@
+from collections import defaultdict
+
 from django.db import models
 from django.dispatch import receiver
 
 from .directories import Supplier, Client, Product
+from .querysets import TotalsQuerySet
+
+
+class OrderQuerySet(TotalsQuerySet):
+    totals = {
+        'ordered_quantity': 'items__quantity',
+        'confirmed_quantity': 'confirmed_items__quantity',
+        'invoiced_quantity': 'invoiced_items__quantity',
+        'cancelled_quantity': 'cancelled_items__quantity',
+    }
 
 
 class Order(models.Model):
@@ -12,9 +24,15 @@ class Order(models.Model):
         Supplier, on_delete=models.CASCADE, related_name="orders")
     comment = models.CharField(
         max_length=450, null=True, blank=True, default=None)
+    file_hash = models.CharField(
+        max_length=64, blank=True, default="", db_index=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
 
     @property
     def total_quantity(self):
+        if (ordered_quantity := getattr(self, 'ordered_quantity', None)) is not None:
+            return ordered_quantity
         return sum(item.quantity for item in self.items.all())
 
     class Meta:
@@ -29,6 +47,13 @@ class Order(models.Model):
             '-', maxsplit=1)[0].strip()
         return "-".join([name_starts, name_ends])
 
+    @classmethod
+    def unconfirmed(cls, supplier, confirmation_date):
+        return cls.objects.filter(
+            supplier=supplier, order_date__lte=confirmation_date,
+        ).with_totals().filter(
+            ordered_quantity__gt=models.F("confirmed_quantity")).order_by("order_date", "id")
+
     def __str__(self):
         return self.name
 
@@ -51,21 +76,53 @@ class OrderItem(models.Model):
     class Meta:
         unique_together = ("order", "client", "product")
 
+    @staticmethod
+    def check_clients(client_ids):
+        client_ids = set(client_ids)
+        if unknown_clients := client_ids - set(Client.objects.filter(
+                id__in=client_ids).values_list("id", flat=True)):
+            raise ValueError(
+                f"Unknown clients: {', '.join(sorted(map(str, unknown_clients)))}")
+
     @classmethod
-    def save_order_items(cls, order_data_json, order):
+    def plan_order_items(cls, order_data_json):
+        order_data_json = [
+            item for item in order_data_json if item.get("product") != "total"]
+        products = {}
+        quantities = defaultdict(int)
         for item in order_data_json:
             product_id = item.get("product")
-            if product_id != "total":
-                second_id = item.get("second_id")
-                if product_id == second_id:
-                    second_id = None
-                brand_id = product_id.split("_")[1]
-                client_id = item.get("client")
-                quantity = item.get("quantity")
-                product, created = Product.objects.get_or_create(
-                    id=product_id, second_id=second_id, brand_id=brand_id)
-                cls.objects.create(
-                    order_id=order.id,
-                    client_id=client_id,
-                    product_id=product_id,
-                    quantity=quantity)
+            products[product_id] = {
+                'id': product_id,
+                'second_id': (item.get("second_id")
+                              if item.get("second_id") != product_id else None),
+                'brand_id': product_id.split("_")[1],
+            }
+            quantities[(item.get("client"), product_id)] += int(
+                item.get("quantity"))
+        items = [{'client_id': client_id, 'product_id': product_id, 'quantity': quantity}
+                 for (client_id, product_id), quantity in quantities.items()]
+        return list(products.values()), items
+
+    @classmethod
+    def stage_order_items(cls, order_data_json):
+        products, items = cls.plan_order_items(order_data_json)
+        cls.check_clients(item['client_id'] for item in items)
+        return {
+            'products': products,
+            'items': items,
+        }
+
+    @classmethod
+    def save_order_items(cls, order_data_json, order, plan=None):
+        if plan is None:
+            plan = cls.stage_order_items(order_data_json)
+        else:
+            cls.check_clients(item['client_id'] for item in plan['items'])
+        Product.register_products(plan['products'])
+        return cls.objects.bulk_create(
+            [cls(order_id=order.id, **item) for item in plan['items']],
+            update_conflicts=True,
+            unique_fields=["order", "client", "product"],
+            update_fields=["quantity"],
+        )
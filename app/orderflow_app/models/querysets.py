@@ -0,0 +1,32 @@
+from django.db import models
+from django.db.models.functions import Coalesce
+
+AMOUNT_FIELD = models.DecimalField(max_digits=16, decimal_places=2)
+
+
+def amount(related_name=None):
+    prefix = f"{related_name}__" if related_name else ""
+    return models.ExpressionWrapper(
+        models.F(f"{prefix}price") * models.F(f"{prefix}quantity"), output_field=AMOUNT_FIELD)
+
+
+def related_total(model, expression):
+    output_field = AMOUNT_FIELD if isinstance(
+        expression, models.Expression) else models.IntegerField()
+    return Coalesce(models.Subquery(
+        model.objects.filter(pk=models.OuterRef("pk")).values("pk").annotate(
+            total=models.Sum(expression)).values("total"), output_field=output_field),
+        models.Value(0), output_field=output_field)
+
+
+class TotalsQuerySet(models.QuerySet):
+    totals = {}
+
+    def with_totals(self):
+        return self.annotate(**{name: related_total(self.model, expression)
+                                for name, expression in self.totals.items()})
+
+
+class ItemQuerySet(models.QuerySet):
+    def with_totals(self):
+        return self.annotate(amount=amount())
@@ -0,0 +1,107 @@
+import json
+import logging
+import zlib
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from .directories import Supplier
+
+log = logging.getLogger(__name__)
+
+
+def new_token():
+    return uuid4().hex
+
+
+class ImportStaging(models.Model):
+    class Kind(models.TextChoices):
+        ORDER = "order"
+        CONFIRMATION = "confirmation"
+        INVOICE = "invoice"
+    token = models.CharField(
+        max_length=32, primary_key=True, default=new_token)
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    payload = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    @staticmethod
+    def to_columns(rows):
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        return {column: [row.get(column) for row in rows] for column in columns}
+
+    @staticmethod
+    def to_rows(columns):
+        return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+    @classmethod
+    def stage(cls, kind, data, plan, file_hash=None):
+        if file_hash:
+            plan = {**plan, 'file_hash': file_hash}
+        payload = {
+            'data': cls.to_columns(data),
+            'plan': {
+                **plan,
+                'products': cls.to_columns(plan['products']),
+                'items': cls.to_columns(plan['items']),
+            },
+        }
+        staging = cls.objects.create(
+            kind=kind,
+            payload=zlib.compress(json.dumps(payload).encode()),
+            expires_at=timezone.now() + timedelta(seconds=settings.IMPORT_STAGING_TTL),
+        )
+        return staging.token
+
+    @classmethod
+    def load(cls, kind, token):
+        staging = cls.objects.filter(
+            kind=kind, token=token, expires_at__gt=timezone.now()).first()
+        if staging is None:
+            raise ValueError("Uploaded data has expired, preview the file again")
+        payload = json.loads(zlib.decompress(staging.payload))
+        plan = payload['plan']
+        plan['products'] = cls.to_rows(plan['products'])
+        plan['items'] = cls.to_rows(plan['items'])
+        return cls.to_rows(payload['data']), plan
+
+    @classmethod
+    def discard(cls, token):
+        cls.objects.filter(token=token).delete()
+
+    @classmethod
+    def purge(cls):
+        deleted, _ = cls.objects.filter(expires_at__lte=timezone.now()).delete()
+        return deleted
+
+
+class ImportJob(models.Model):
+    class Status(models.TextChoices):
+        PENDING = "pending"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+    id = models.CharField(
+        max_length=32, primary_key=True, default=new_token)
+    kind = models.CharField(max_length=20, choices=ImportStaging.Kind.choices)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.PENDING)
+    progress = models.PositiveSmallIntegerField(default=0)
+    message = models.TextField(blank=True, default="")
+    supplier = models.ForeignKey(
+        Supplier, on_delete=models.CASCADE, related_name="import_jobs")
+    file_name = models.CharField(max_length=450)
+    content = models.BinaryField()
+    document = models.JSONField(default=dict)
+    result = models.CharField(max_length=450, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def update(self, **fields):
+        for field, value in fields.items():
+            setattr(self, field, value)
+        self.save(update_fields=[*fields, "updated_at"])
@@ -0,0 +1,407 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import PurePath
+
+import django
+
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from .models.directories import Brand
+
+log = logging.getLogger(__name__)
+
+PARSER_VERSION = 1
+
+ORDER = "order"
+CONFIRMATION = "confirmation"
+INVOICE = "invoice"
+
+OUTPUT_COLUMNS = {
+    ORDER: ['product', 'second_id', 'client', 'quantity'],
+    CONFIRMATION: ['product', 'product_name', 'quantity', 'price', 'delivery_date', 'total_price'],
+    INVOICE: ['product', 'product_name', 'quantity', 'price', 'total_price'],
+}
+
+DTYPES = {
+    'numeric': pd.to_numeric,
+}
+
+
+@dataclass(frozen=True)
+class Padding:
+    brand: str
+    width: int
+    whole_id: bool = False
+
+
+@dataclass(frozen=True)
+class Layout:  # pylint: disable=R0902
+    kind: str
+    pattern: str
+    columns: dict
+    anchor: str | None = None
+    code_label: str | None = None
+    file_fields: str | None = None
+    date_pattern: str | None = None
+    date_format: str | None = None
+    defaults: dict = field(default_factory=dict)
+    dtypes: dict = field(default_factory=dict)
+    clean: dict = field(default_factory=dict)
+    upper: tuple = ()
+    ids: tuple = ('product',)
+    brand_lookup: bool = False
+    padding: tuple = ()
+    until_blank: bool = True
+
+
+class ParseCache:
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+PARSE_CACHE = ParseCache(settings.PARSE_CACHE_SIZE)
+
+
+def file_hash(uploaded_file):
+    digest = hashlib.sha256()
+    uploaded_file.seek(0)
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+    uploaded_file.seek(0)
+    return digest.hexdigest()
+
+
+def cell_value(value):
+    if isinstance(value, str):
+        return value.strip() if value else None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def find_labels(row, values):
+    for i, value in enumerate(row[:-1]):
+        if isinstance(value, str):
+            for label, label_value in values.items():
+                if label_value is None and label in value:
+                    values[label] = row[i + 1]
+
+
+def brand_table():
+    return [(name.upper(), brand_id) for brand_id, name in Brand.objects.order_by(
+        'pk').values_list('id', 'name')]
+
+
+def brand_ids(brand_names, brands=None):
+    if brands is None:
+        brands = brand_table()
+    return {
+        brand_name: next((brand_id for name, brand_id in brands
+                          if brand_name.upper() in name), None)
+        if isinstance(brand_name, str) else None
+        for brand_name in set(brand_names)
+    }
+
+
+class Parser:  # pylint: disable=R0902
+
+    def __init__(self, supplier_id, layout):
+        self.supplier_id = supplier_id
+        self.layout = layout
+        self.pattern = re.compile(layout.pattern, re.IGNORECASE)
+        self.file_fields = re.compile(
+            layout.file_fields) if layout.file_fields else None
+        self.date_pattern = re.compile(
+            layout.date_pattern) if layout.date_pattern else None
+        self.named = {source.lower(): target for target, source in layout.columns.items()
+                      if isinstance(source, str)}
+        self.positions = {source: target for target, source in layout.columns.items()
+                          if isinstance(source, int)}
+        self.clean = {target: str.maketrans('', '', chars)
+                      for target, chars in layout.clean.items()}
+        self.dtypes = {target: DTYPES[dtype]
+                       for target, dtype in layout.dtypes.items()}
+        self.labels = (layout.code_label,) if layout.code_label else ()
+
+    def matches(self, file_name):
+        return self.pattern.search(file_name) is not None
+
+    def header_columns(self, row):
+        columns = {}
+        for i, value in enumerate(row):
+            if isinstance(value, str) and (target := self.named.get(value.lower())):
+                columns.setdefault(target, i)
+        taken = set(columns.values())
+        for i, target in self.positions.items():
+            if i < len(row) and i not in taken:
+                columns[target] = i
+        for target in self.layout.columns:
+            if target not in columns and target not in self.layout.defaults:
+                raise ValidationError(
+                    f"No '{self.layout.columns[target]}' column in file")
+        return columns
+
+    def read(self, uploaded_file):
+        anchor = self.layout.anchor
+        values = dict.fromkeys(self.labels)
+        columns = None
+        data = None
+        workbook = openpyxl.load_workbook(
+            uploaded_file, read_only=True, data_only=True)
+        try:
+            sheet_rows = workbook.worksheets[0].iter_rows(values_only=True)
+            for row in sheet_rows:
+                row = [cell_value(value) for value in row]
+                find_labels(row, values)
+                if anchor is None or (row and row[0] == anchor):
+                    columns = self.header_columns(row)
+                    break
+            if columns is None:
+                raise ValidationError(f"No '{anchor}' row in file")
+            data = {target: [] for target in columns}
+            for row in sheet_rows:
+                row = [cell_value(value) for value in row]
+                if not row or row[0] is None:
+                    if self.layout.until_blank:
+                        break
+                    continue
+                row_values = [row[i] if i < len(row) else None
+                              for i in columns.values()]
+                if not self.layout.until_blank and None in row_values:
+                    continue
+                for target, value in zip(columns, row_values):
+                    data[target].append(value)
+            if None in values.values():
+                for row in sheet_rows:
+                    find_labels([cell_value(value) for value in row], values)
+        finally:
+            workbook.close()
+        return values, pd.DataFrame(data, dtype=object)
+
+    def file_values(self, file_name):
+        if self.file_fields is None:
+            return {}
+        match = self.file_fields.match(file_name)
+        if match is None:
+            raise ValidationError(
+                f"File name '{file_name}' does not match {self.supplier_id} {self.layout.kind} layout")
+        return match.groupdict()
+
+    def document_date(self, file_name):
+        if self.date_pattern is None:
+            return None
+        match = self.date_pattern.search(PurePath(file_name).stem)
+        if match is None:
+            return None
+        try:
+            return datetime.strptime(match.group(1), self.layout.date_format).date()
+        except ValueError:
+            return None
+
+    def normalize(self, df, file_values, brands=None):
+        layout = self.layout
+        for target, source in layout.defaults.items():
+            if target not in df.columns:
+                df[target] = df[source] if source in df.columns else file_values[source]
+        for target, table in self.clean.items():
+            df[target] = df[target].astype(str).str.translate(table)
+        for target in layout.upper:
+            df[target] = df[target].str.upper()
+        for target, dtype in self.dtypes.items():
+            df[target] = dtype(df[target])
+        if layout.brand_lookup:
+            brands = brand_ids(df['brand'], brands)
+            if 'brand' not in layout.columns:
+                for brand_name, brand_id in brands.items():
+                    if brand_id is None:
+                        raise ValidationError(
+                            f"Brand {brand_name} must be in Brands")
+            df['brand'] = df['brand'].map(brands)
+        brand = df['brand'].astype(str)
+        self.pad_products(df, brand, whole_id=False)
+        for target in layout.ids:
+            df[target] = df[target] + "_" + brand
+        self.pad_products(df, brand, whole_id=True)
+        return df
+
+    def pad_products(self, df, brand, whole_id):
+        for padding in self.layout.padding:
+            if padding.whole_id == whole_id:
+                df['product'] = df['product'].where(
+                    brand != padding.brand, df['product'].str.zfill(padding.width))
+
+    @staticmethod
+    def finish_order(df):
+        df = df.groupby(["product", "second_id", "client", ])[
+            "quantity"].sum()
+        df.loc['total'] = df.sum()
+        return df.reset_index()
+
+    @staticmethod
+    def finish_document(df):
+        df.index = df.index + 1
+        df.loc['total', 'total_price'] = df['total_price'].sum()
+        return df.fillna('').replace('unknown', "").infer_objects(copy=False)
+
+    def parse(self, uploaded_file, brands=None):
+        values, df = self.read(uploaded_file)
+        df = self.normalize(df, self.file_values(uploaded_file.name), brands)
+        if self.layout.kind == ORDER:
+            df = self.finish_order(df)
+        else:
+            df = self.finish_document(df)
+        code = values.get(self.layout.code_label)
+        return code, df[OUTPUT_COLUMNS[self.layout.kind]]
+
+
+PARSERS = {}
+
+
+def register(supplier_id, layout):
+    PARSERS[supplier_id, layout.kind] = Parser(supplier_id, layout)
+
+
+def get_parser(supplier, kind):
+    return PARSERS.get((supplier.id, kind))
+
+
+def parsers_for(file_name):
+    return [parser for parser in PARSERS.values() if parser.matches(file_name)]
+
+
+def cache_key(uploaded_file, supplier, kind, brands=None):
+    return (file_hash(uploaded_file), uploaded_file.name, supplier.id, kind, PARSER_VERSION,
+            tuple(brands) if brands is not None else None)
+
+
+def parse(uploaded_file, supplier, kind):
+    code, data = None, None
+    if parser := get_parser(supplier, kind):
+        brands = brand_table() if parser.layout.brand_lookup else None
+        key = cache_key(uploaded_file, supplier, kind, brands)
+        if (parsed := PARSE_CACHE.get(key)) is None:
+            parsed = parser.parse(uploaded_file, brands)
+            PARSE_CACHE.put(key, parsed)
+        code, data = parsed[0], parsed[1].copy()
+    else:
+        log.warning("No %s layout for supplier %s", kind, supplier.id)
+    return code, data
+
+
+def parse_content(supplier_id, kind, file_name, content, brands):
+    return PARSERS[supplier_id, kind].parse(SimpleUploadedFile(file_name, content), brands)
+
+
+def parse_files(uploaded_files, supplier, kind):  # pylint: disable=R0914
+    parser = get_parser(supplier, kind)
+    if parser is None:
+        raise ValidationError(f"No {kind} layout for supplier {supplier.id}")
+    brands = brand_table() if parser.layout.brand_lookup else None
+    results = [None] * len(uploaded_files)
+    pending = {}
+    for i, uploaded_file in enumerate(uploaded_files):
+        key = cache_key(uploaded_file, supplier, kind, brands)
+        if (parsed := PARSE_CACHE.get(key)) is not None:
+            results[i] = parsed
+        else:
+            pending[i] = key
+    workers = min(settings.IMPORT_WORKERS, len(pending))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            futures = {i: executor.submit(parse_content, supplier.id, kind, uploaded_files[i].name,
+                                          uploaded_files[i].read(), brands) for i in pending}
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e:  # pylint: disable=W0718
+                    results[i] = e
+    else:
+        for i in pending:
+            try:
+                results[i] = parser.parse(uploaded_files[i], brands)
+            except Exception as e:  # pylint: disable=W0718
+                results[i] = e
+    for i, key in pending.items():
+        if not isinstance(results[i], Exception):
+            PARSE_CACHE.put(key, results[i])
+    return [result if isinstance(result, Exception) else (result[0], result[1].copy())
+            for result in results]
+
+
+register("T00016", Layout(
+    kind=ORDER,
+    pattern=r"order",
+    columns={'product': 0, 'second_id': 1,
+             'quantity': 'quantity', 'client': 'note'},
+    file_fields=r"[^-]*-(?P<client>[^-]*)-(?P<brand>[^-]*)",
+    defaults={'second_id': 'product', 'client': 'client', 'brand': 'brand'},
+    dtypes={'quantity': 'numeric'},
+    clean={'product': '.', 'second_id': '.',
+           'client': '. ', 'brand': '. '},
+    date_pattern=r"(\d{2}-\d{2}-\d{4})",
+    date_format="%d-%m-%Y",
+    upper=('client', 'brand'),
+    ids=('product', 'second_id'),
+    padding=(Padding("B05", 14, whole_id=True),),
+    until_blank=False,
+))
+
+register("T00016", Layout(
+    kind=CONFIRMATION,
+    pattern=r"confirmation",
+    anchor='Pos',
+    code_label='Ihre Bestellnummer:',
+    columns={'product': 'Teilenummer', 'product_name': 'Bezeichnung', 'quantity': 'Menge',
+             'price': 'Preise', 'delivery_date': 'Liefertermin', 'total_price': 'Betrag'},
+    file_fields=r"[^ ]* (?P<brand>[^ ]*)",
+    date_pattern=r"(\d{6})$",
+    date_format="%d%m%y",
+    defaults={'brand': 'brand'},
+    clean={'product': '.'},
+    brand_lookup=True,
+))
+
+register("T00016", Layout(
+    kind=INVOICE,
+    pattern=r"invoice",
+    anchor='Pos.',
+    code_label='Rechnungsnummer:',
+    columns={'product': 'Artikel', 'brand': 'Handelsmarke', 'product_name': 'Artikelbezeichnung',
+             'quantity': 'Menge', 'price': 'Preis, EUR', 'total_price': 'Betrag, EUR'},
+    date_pattern=r"(\d{6})",
+    date_format="%d%m%y",
+    clean={'product': '.'},
+    brand_lookup=True,
+    padding=(Padding("B05", 14),),
+))
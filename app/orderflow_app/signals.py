@@ -2,6 +2,7 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
 
+from .models.directories import post_bulk_save
 from .tasks import log_action
 
 
@@ -17,6 +18,17 @@ def log_post_save(sender, instance, created, **kwargs):
         })
 
 
+@receiver(post_bulk_save)
+def log_post_bulk_save(sender, instances, **kwargs):
+    if settings.DEBUG is False and sender.__name__.lower() in settings.MODEL_SIGNALS:
+        log_action.delay({
+            "model": sender.__name__,
+            "id": [instance.pk for instance in instances],
+            "name": f"{len(instances)} {sender.__name__.lower()}s",
+            "action": "saved"
+        })
+
+
 @receiver(post_delete)
 def log_post_delete(sender, instance, **kwargs):
     if settings.DEBUG is False and sender.__name__.lower() in settings.MODEL_SIGNALS:
@@ -3,10 +3,16 @@ from pathlib import Path
 from datetime import datetime
 
 from django.core import management
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.conf import settings
+from django.db import transaction
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
+from . import parsers
+from .importers import IMPORTERS
+from .models.staging import ImportStaging, ImportJob
+
 
 log = get_task_logger(__name__)
 
@@ -46,3 +52,43 @@ def create_backup():
     }
     log.info(f"Got action: {result}")
     return result
+
+
+@shared_task
+def purge_import_staging():
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "action": "import_staging_purge",
+        "deleted": ImportStaging.purge(),
+    }
+    log.info(f"Got action: {result}")
+    return result
+
+
+@shared_task
+def run_import_job(job_id):
+    job = ImportJob.objects.select_related("supplier").get(pk=job_id)
+    job.update(status=ImportJob.Status.RUNNING,
+               progress=10, message="Reading file")
+    try:
+        importer = IMPORTERS[job.kind]
+        uploaded_file = SimpleUploadedFile(job.file_name, bytes(job.content))
+        parsed = parsers.parse(uploaded_file, job.supplier, job.kind)
+        job.update(progress=40, message="Allocating items")
+        entry = importer.stage(uploaded_file, parsed, job.document)
+        job.update(progress=70, message="Saving items")
+        with transaction.atomic():
+            document = importer.save(entry)
+        job.update(status=ImportJob.Status.DONE, progress=100, message="",
+                   result=document.pk, content=b"")
+    except Exception as e:  # pylint: disable=W0718
+        job.update(status=ImportJob.Status.FAILED, message=str(e), content=b"")
+    result = {
+        "timestamp": datetime.now().isoformat(),
+        "action": "import_job",
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+    }
+    log.info(f"Got action: {result}")
+    return result
@@ -31,10 +31,18 @@ from ..models.cancellations import (
     Cancellation,
     CancellationItem,
 )
+from .. import parsers
 
 log = logging.getLogger(__name__)
 
 
+@pytest.fixture(autouse=True)
+def parse_cache():
+    parsers.PARSE_CACHE.clear()
+    yield parsers.PARSE_CACHE
+    parsers.PARSE_CACHE.clear()
+
+
 @pytest.fixture()
 def clients(amount=2):
     result_dict = {}
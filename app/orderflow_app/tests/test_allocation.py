@@ -0,0 +1,58 @@
+import pytest
+
+from ..allocation import (
+    left_quantities,
+    allocate,
+)
+
+
+@pytest.fixture
+def confirmed_rows():
+    return [
+        {"client_id": "C1", "confirmation_id": "T0", "order_id": "O0", "quantity": 10},
+        {"client_id": "C0", "confirmation_id": "T0", "order_id": "O1", "quantity": 20},
+        {"client_id": "C1", "confirmation_id": "T0", "order_id": "O0", "quantity": 5},
+        {"client_id": "Unknown", "confirmation_id": "T1", "order_id": None, "quantity": 7},
+    ]
+
+
+def test_left_quantities(confirmed_rows):
+    invoiced_rows = [
+        {"client_id": "C1", "confirmation_id": "T0", "order_id": "O0", "quantity": 15},
+        {"client_id": "Unknown", "confirmation_id": "T1", "order_id": None, "quantity": 2},
+    ]
+    cancelled_rows = [
+        {"client_id": "C0", "confirmation_id": "T0", "order_id": "O1", "quantity": 5},
+    ]
+    assert left_quantities(confirmed_rows, [invoiced_rows, cancelled_rows]) == [
+        {"client_id": "C0", "confirmation_id": "T0", "order_id": "O1", "quantity": 15},
+        {"client_id": "Unknown", "confirmation_id": "T1", "order_id": None, "quantity": 5},
+    ]
+
+
+def test_left_quantities_exhausted(confirmed_rows):
+    invoiced_rows = [
+        {"client_id": "Unknown", "confirmation_id": None, "order_id": None, "quantity": 42},
+    ]
+    assert not left_quantities(confirmed_rows, [invoiced_rows])
+    assert not left_quantities([], [])
+
+
+@pytest.mark.parametrize("quantity,expected_quantities,expected_rest", [
+    (0, [], 0),
+    (12, [10, 2], 0),
+    (30, [10, 20], 0),
+    (35, [10, 20], 5),
+])
+def test_allocate(quantity, expected_quantities, expected_rest):
+    balances = [
+        {"client_id": "C1", "quantity": 10},
+        {"client_id": "C0", "quantity": 20},
+    ]
+    allocations, rest = allocate(quantity, balances)
+    assert [allocation["quantity"]
+            for allocation in allocations] == expected_quantities
+    assert [allocation["client_id"] for allocation in allocations] == [
+        "C1", "C0"][:len(expected_quantities)]
+    assert rest == expected_rest
+    assert balances[0]["quantity"] == 10
@@ -0,0 +1,79 @@
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..models.confirmations import Confirmation
+from ..models.invoices import InvoiceItem
+from ..models.openquantities import (
+    OpenQuantity,
+)
+from ..models.orders import Order
+
+
+@pytest.mark.django_db
+def test_rebuild_open_quantities(confirmationitems, invoiceitems, cancellationitem):
+    OpenQuantity.objects.update(quantity=1)
+    with pytest.raises(CommandError):
+        call_command('rebuild_open_quantities', '--check')
+    call_command('rebuild_open_quantities')
+    call_command('rebuild_open_quantities', '--check')
+    assert OpenQuantity.verify() == {}
+    assert not OpenQuantity.objects.filter(quantity=0).exists()
+
+
+@pytest.mark.django_db
+def test_benchmark_parsers(tmp_path, supplier, order_excel, confirmation_excel, invoice_excel):
+    for excel_file in (order_excel, confirmation_excel, invoice_excel):
+        (tmp_path / f"{Path(excel_file.name).stem}.xlsx").write_bytes(excel_file.read())
+    stdout = StringIO()
+    call_command('benchmark_parsers', str(tmp_path), '--repeat', '2', stdout=stdout)
+    lines = stdout.getvalue().splitlines()
+    assert len(lines) == 3
+    assert all("| T00016 |" in line and " rows, best " in line for line in lines)
+    (tmp_path / "Confirmation X9 010125.xlsx").write_bytes(confirmation_excel.read())
+    with pytest.raises(CommandError):
+        call_command('benchmark_parsers', str(tmp_path), stdout=StringIO())
+
+
+@pytest.mark.django_db
+def test_ingest_folder(tmp_path, clients, supplier, order_excel, confirmation_excel):
+    (tmp_path / order_excel.name).write_bytes(order_excel.read())
+    (tmp_path / "Confirmation B0 010125.xlsx").write_bytes(confirmation_excel.read())
+    (tmp_path / "Invoice0 010125.xlsx").write_bytes(b"broken")
+    (tmp_path / "Notes.xlsx").write_bytes(b"")
+    stdout = StringIO()
+    call_command('ingest_folder', str(tmp_path), stdout=stdout)
+    lines = stdout.getvalue().splitlines()
+    order_id = Order.name_into_id(order_excel.name)
+    assert f'{order_excel.name} | order: imported as {order_id}' in lines
+    assert 'Confirmation B0 010125.xlsx | confirmation: imported as T3' in lines
+    assert lines[-1] == 'Imported 2 files, failed 2 files'
+    assert Confirmation.objects.get(pk='T3').order.get().pk == order_id
+    assert sorted(path.name for path in (tmp_path / 'done').iterdir()) == [
+        "Confirmation B0 010125.xlsx", order_excel.name]
+    assert sorted(path.name for path in (tmp_path / 'failed').iterdir()) == [
+        "Invoice0 010125.xlsx", "Notes.xlsx"]
+    assert not list(tmp_path.glob('*.xlsx'))
+
+
+@pytest.mark.django_db
+def test_backfill(tmp_path, clients, supplier,  # pylint: disable=R0913,R0917
+                  order_excel, confirmation_excel, invoice_excel):
+    for excel_file in (order_excel, confirmation_excel, invoice_excel):
+        (tmp_path / f"{Path(excel_file.name).stem}.xlsx").write_bytes(excel_file.read())
+    (tmp_path / "Notes.xlsx").write_bytes(b"")
+    call_command('backfill', str(tmp_path), '--dry-run', stdout=StringIO())
+    assert not Order.objects.exists()
+    stdout = StringIO()
+    call_command('backfill', str(tmp_path), stdout=stdout)
+    lines = stdout.getvalue().splitlines()
+    assert 'Allocated 3 files, failed 1 files' in lines
+    assert 'OrderItem: 2 rows' in lines
+    assert 'ConfirmationItem: 2 rows' in lines
+    assert 'InvoiceItem: 2 rows' in lines
+    assert Confirmation.objects.get(pk='T3').order.get().pk == Order.name_into_id(order_excel.name)
+    assert InvoiceItem.objects.filter(confirmation_id='T3').count() == 2
+    assert OpenQuantity.verify() == {}
@@ -1,7 +1,14 @@
+from io import BytesIO
 from json import loads
 from datetime import datetime
 
+import openpyxl
 import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from ..models.directories import Brand
+from .. import parsers
+from ..forms.cancellations import CancellationModelForm
+from ..forms.confirmations import EditConfirmationItemFormSet
 from ..forms.uploadfile import (
     UploadOrderForm,
     UploadConfirmationForm,
@@ -60,3 +67,168 @@ def test_uploadinvoiceform(invoice_excel, supplier):
         {'product': '', 'product_name': '', 'quantity': '', 'price': '', 'total_price': 501.4},]
     assert invoice_data_json_expected == loads(invoice_data_json)
     assert invoice_code == "Invoice01"
+
+
+@pytest.mark.django_db
+def test_cancellationmodelform(django_assert_max_num_queries, supplier, brands, confirmationitems):
+    data = {
+        'cancellation_date': '2025-01-01',
+        'supplier': supplier.id,
+        'brand': brands.get("0").id,
+        'cancellation_data': 'Order\r\nItem\r\nQty\r\nT0\r\nTESTPRODUCT0\r\n1\r\n'
+        'T0\r\nTESTPRODUCT0\r\n1\r\nT1\r\nTESTPRODUCT1\r\n2',
+    }
+    form = CancellationModelForm(data=data)
+    with django_assert_max_num_queries(6):
+        assert form.is_valid()
+    assert form.cleaned_data['cancellation_data'] == [
+        {'product': 'TESTPRODUCT0_B0', 'confirmation': 'T0', 'quantity': 1},
+        {'product': 'TESTPRODUCT1_B0', 'confirmation': 'T1', 'quantity': 2},
+    ]
+    data['cancellation_data'] = 'Order\r\nT1'
+    form = CancellationModelForm(data=data)
+    assert form.is_valid()
+    assert form.cleaned_data['cancellation_data'] == [
+        {'confirmation': 'T1', 'product': 'TESTPRODUCT0_B0'},
+        {'confirmation': 'T1', 'product': 'TESTPRODUCT1_B0'},
+    ]
+    data['cancellation_data'] = 'Item\r\nQty\r\nTESTPRODUCT0\r\n1\r\nTESTPRODUCT7\r\n1'
+    form = CancellationModelForm(data=data)
+    assert not form.is_valid()
+    assert form.errors['cancellation_data'] == ["Invalid item"]
+
+
+@pytest.mark.django_db
+def test_confirmationitemformset_prices(django_assert_max_num_queries, confirmationitems):
+    confirmation = confirmationitems.get("0").confirmation
+    with django_assert_max_num_queries(8):
+        formset = EditConfirmationItemFormSet(form_kwargs={'confirmation': confirmation})
+        html = formset.as_p()
+    for item in confirmation.items.all():
+        assert f'value="{item.product_id}" data-price="{item.price}"' in html
+
+
+@pytest.mark.django_db
+def test_uploadinvoiceform_label_in_first_row(supplier, brands):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append([None, None, 'Rechnungsnummer:', 'INVOICE5'])
+    sheet.append([])
+    sheet.append(['Pos.', 'Artikel', 'Handelsmarke', '  Artikelbezeichnung',
+                 'Menge', 'Preis, EUR', 'Betrag, EUR'])
+    sheet.append([1, 'TESTPRODUCT.0', 'B0', 'Test product 0', 2, 1.5, 3.0])
+    sheet.append([2, 'TESTPRODUCT.1', 'B0', 'Test product 1', '4', 0.5, 2])
+    sheet.append([None, None, None, None, None, None, 5])
+    sheet.append([None, 'Footer'])
+    content = BytesIO()
+    workbook.save(content)
+    invoice_excel = SimpleUploadedFile(
+        "Test Invoice5 010125.xlsx", content.getvalue())
+    invoice_id, invoice_data = UploadInvoiceForm().load_excel_invoice(
+        invoice_excel, supplier=supplier)
+    assert invoice_id == "INVOICE5"
+    assert loads(UploadInvoiceForm.data_json(invoice_data)) == [
+        {'product': 'TESTPRODUCT0_B0', 'product_name': 'Test product 0', 'quantity': 2,
+            'price': 1.5, 'total_price': 3},
+        {'product': 'TESTPRODUCT1_B0', 'product_name': 'Test product 1', 'quantity': '4',
+            'price': 0.5, 'total_price': 2},
+        {'product': '', 'product_name': '', 'quantity': '', 'price': '', 'total_price': 5.0},
+    ]
+
+
+@pytest.mark.django_db
+def test_uploadinvoiceform_brands(django_assert_num_queries, supplier, brands):
+    Brand.objects.create(id="B05", name="Bosch Rexroth")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Rechnungsnummer:', 'INVOICE6'])
+    sheet.append(['Pos.', 'Artikel', 'Handelsmarke', 'Artikelbezeichnung',
+                 'Menge', 'Preis, EUR', 'Betrag, EUR'])
+    sheet.append([1, '123.45', 'bosch', 'Test product 0', 1, 1, 1])
+    sheet.append([2, 'TESTPRODUCT.1', 'BRAND B1', 'Test product 1', 1, 1, 1])
+    sheet.append([3, 'TESTPRODUCT.2', 'Brand', 'Test product 2', 1, 1, 1])
+    sheet.append([4, 'TESTPRODUCT.3', 'Other', 'Test product 3', 1, 1, 1])
+    content = BytesIO()
+    workbook.save(content)
+    invoice_excel = SimpleUploadedFile(
+        "Test Invoice6 010125.xlsx", content.getvalue())
+    with django_assert_num_queries(1):
+        _, invoice_data = UploadInvoiceForm().load_excel_invoice(
+            invoice_excel, supplier=supplier)
+    assert list(invoice_data['product']) == [
+        '00000000012345_B05', 'TESTPRODUCT1_B1', 'TESTPRODUCT2_B0', 'TESTPRODUCT3_None', '']
+
+
+@pytest.mark.django_db
+def test_uploadorderform_second_id(supplier):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(['Suppliers P/N', 'Suppliers P/N', 'Quantity', 'Note'])
+    sheet.append([])
+    sheet.append(['TESTPRODUCT1', 'TESTPRODUCT.1', 3, 'c.1'])
+    sheet.append(['TESTPRODUCT2', 'TESTPRODUCT.2', '4', None])
+    content = BytesIO()
+    workbook.save(content)
+    order_excel = SimpleUploadedFile(
+        "TEST order-K.diverse- B1-T.00016-03-06-2025.xlsx", content.getvalue())
+    order_data = UploadOrderForm.load_excel_order(order_excel, supplier)
+    assert loads(UploadOrderForm.data_json(order_data)) == [
+        {"product": "TESTPRODUCT1_B1", "second_id": "TESTPRODUCT1_B1", "client": "C1", "quantity": 3},
+        {"product": "total", "second_id": "", "client": "", "quantity": 3},
+    ]
+    supplier.id = "T00017"
+    assert UploadOrderForm.load_excel_order(order_excel, supplier) is None
+
+
+@pytest.mark.django_db
+def test_uploadconfirmationform_cache(mocker, confirmation_excel, supplier):
+    read = mocker.spy(parsers.Parser, 'read')
+    confirmation_code, confirmation_data = UploadConfirmationForm.load_excel_confirmation(
+        confirmation_excel, supplier=supplier)
+    confirmation_data['product'] = ''
+    cached_code, cached_data = UploadConfirmationForm.load_excel_confirmation(
+        confirmation_excel, supplier=supplier)
+    assert read.call_count == 1
+    assert cached_code == confirmation_code
+    assert list(cached_data['product']) == ['TESTPRODUCT0_B0', 'TESTPRODUCT1_B0', '']
+    cache = parsers.ParseCache(2)
+    for key in 'abc':
+        cache.put(key, key)
+        cache.get('a')
+    assert list(cache.entries) == ['c', 'a']
+
+
+@pytest.mark.django_db
+def test_parse_cache_key(settings, supplier, brands):
+    settings.IMPORT_WORKERS = 1
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['Suppliers P/N', 'Suppliers P/N', 'Quantity'])
+    workbook.active.append(['TESTPRODUCT1', 'TESTPRODUCT.1', 3])
+    content = BytesIO()
+    workbook.save(content)
+    names = {(client, brand): f"TEST order-{client}- {brand}-T00016-03-06-2025.xlsx"
+             for client, brand in (("C0", "B0"), ("C1", "B1"))}
+    for (client, brand), name in names.items():
+        order_data = UploadOrderForm.load_excel_order(
+            SimpleUploadedFile(name, content.getvalue()), supplier)
+        assert list(order_data['product']) == [f'TESTPRODUCT1_{brand}', 'total']
+        assert list(order_data['client']) == [client, '']
+    for _ in range(2):
+        results = parsers.parse_files(
+            [SimpleUploadedFile(name, content.getvalue()) for name in names.values()],
+            supplier, parsers.ORDER)
+        assert [(data['client'][0], data['product'][0]) for _, data in results] == [
+            ("C0", "TESTPRODUCT1_B0"), ("C1", "TESTPRODUCT1_B1")]
+    workbook = openpyxl.Workbook()
+    workbook.active.append(['Rechnungsnummer:', 'INVOICE7'])
+    workbook.active.append(['Pos.', 'Artikel', 'Handelsmarke', 'Artikelbezeichnung',
+                            'Menge', 'Preis, EUR', 'Betrag, EUR'])
+    workbook.active.append([1, 'TESTPRODUCT.3', 'Other', 'Test product 3', 1, 1, 1])
+    content = BytesIO()
+    workbook.save(content)
+    invoice_excel = SimpleUploadedFile("Test Invoice7 010125.xlsx", content.getvalue())
+    _, invoice_data = UploadInvoiceForm.load_excel_invoice(invoice_excel, supplier)
+    assert list(invoice_data['product']) == ['TESTPRODUCT3_None', '']
+    Brand.objects.create(id="B7", name="Other brand")
+    _, invoice_data = UploadInvoiceForm.load_excel_invoice(invoice_excel, supplier)
+    assert list(invoice_data['product']) == ['TESTPRODUCT3_B7', '']
@@ -1,7 +1,11 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
 from decimal import Decimal
 
 import pytest
+from django.db import IntegrityError, connection
+from django.db.models import Sum
 from ..models.directories import (
     Client,
     Brand,
@@ -27,6 +31,11 @@ from ..models.cancellations import (
     Cancellation,
     CancellationItem,
 )
+from ..models.openquantities import (
+    OpenQuantity,
+)
+from ..models.report import get_balance
+from ..models.staging import ImportStaging
 
 
 @pytest.mark.django_db
@@ -196,3 +205,361 @@ def test_cancellationitem_creation(cancellationitem):
     assert cancellationitem.order == new_item.order
     assert cancellationitem.product == new_item.product
     assert cancellationitem.quantity == new_item.quantity
+
+
+@pytest.mark.django_db
+def test_get_balance(django_assert_num_queries, confirmationitems, invoiceitems, cancellationitem, orders):
+    expected_balance = [
+        {"product": "TESTPRODUCT0_B0",
+         "confirmation": "Confirmation 1 010125.xlsx",
+         "order": orders.get("0").name,
+         "client": "C0",
+         "quantity": 30},
+        {"product": "TESTPRODUCT1_B0",
+         "confirmation": "Confirmation 1 010125.xlsx",
+         "order": orders.get("1").name,
+         "client": "C1",
+         "quantity": 40},
+    ]
+    with django_assert_num_queries(1):
+        balance = get_balance()
+    assert balance == expected_balance
+    assert get_balance({"confirmation": "T0"}) == []
+    assert get_balance({"order": orders.get("1").id}) == expected_balance[1:]
+
+
+@pytest.mark.django_db
+def test_openquantity(confirmationitems, invoiceitems, cancellationitem, orders, confirmations):
+    assert OpenQuantity.verify() == {}
+    assert OpenQuantity.objects.get(
+        confirmation=confirmations.get("1"), order=orders.get("1")).quantity == 40
+    assert OpenQuantity.objects.get(
+        confirmation=confirmations.get("1"), order=orders.get("2")).quantity == -2
+    invoiceitem = invoiceitems.get("0")
+    invoiceitem.quantity = 4
+    invoiceitem.confirmation = confirmations.get("1")
+    invoiceitem.save()
+    assert OpenQuantity.objects.get(
+        confirmation=confirmations.get("0"), client_id="C0").quantity == 10
+    assert OpenQuantity.objects.get(
+        confirmation=confirmations.get("1"), client_id="C0").quantity == 26
+    invoiceitems.get("1").delete()
+    confirmations.get("1").delete()
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_save_confirmation_items(django_assert_max_num_queries, supplier, orders, orderitems):
+    confirmation = Confirmation.objects.create(
+        name="Confirmation 3 010125.xlsx",
+        confirmation_code="T3",
+        confirmation_date="2025-01-01",
+        supplier=supplier,
+    )
+    confirmation.order.add(orders.get("0"), orders.get("1"))
+    confirmation_data_json = [
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 25, "price": 1.5},
+        {"product": "TESTPRODUCT1_B0", "product_name": "Test product 1",
+            "quantity": 70, "price": 2},
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 20, "price": 1.5},
+        {"product": "TESTPRODUCT9_B0", "product_name": "Test product 9",
+            "quantity": 5, "price": 3},
+        {"product": "", "product_name": "", "quantity": "", "price": ""},
+    ]
+    with django_assert_max_num_queries(18):
+        ConfirmationItem.save_confirmation_items(
+            confirmation_data_json, confirmation)
+    confirmed_quantity = dict(confirmation.items.values_list(
+        "product_id").annotate(quantity=Sum("quantity")).order_by())
+    unknown_quantity = dict(confirmation.items.filter(
+        client_id="Unknown", order=None).values_list("product_id", "quantity"))
+    assert confirmed_quantity == {
+        "TESTPRODUCT0_B0": 45, "TESTPRODUCT1_B0": 70, "TESTPRODUCT9_B0": 5}
+    assert unknown_quantity == {
+        "TESTPRODUCT0_B0": 5, "TESTPRODUCT1_B0": 10, "TESTPRODUCT9_B0": 5}
+    assert Product.objects.get(id="TESTPRODUCT9_B0").name == "Test product 9"
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_save_invoice_items(django_assert_max_num_queries, supplier, invoiceitems):
+    invoice = Invoice.objects.create(
+        name="Invoice 3 010125.xlsx",
+        invoice_date="2025-01-01",
+        supplier=supplier,
+    )
+    invoice_data_json = [
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 35, "price": 1.5},
+        {"product": "TESTPRODUCT1_B0", "product_name": "Test product 1",
+            "quantity": 15, "price": 2},
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 15, "price": 1.5},
+        {"product": "TESTPRODUCT9_B0", "product_name": "Test product 9",
+            "quantity": 5, "price": 3},
+        {"product": "", "product_name": "", "quantity": "", "price": ""},
+    ]
+    with django_assert_max_num_queries(17):
+        InvoiceItem.save_invoice_items(invoice_data_json, invoice)
+    invoiced_items = set(invoice.items.values_list(
+        "product_id", "client_id", "confirmation__confirmation_code", "quantity"))
+    assert invoiced_items == {
+        ("TESTPRODUCT0_B0", "C0", "T1", 30),
+        ("TESTPRODUCT0_B0", "Unknown", None, 20),
+        ("TESTPRODUCT1_B0", "C1", "T1", 15),
+        ("TESTPRODUCT9_B0", "Unknown", None, 5),
+    }
+    assert Product.objects.get(id="TESTPRODUCT9_B0").name == "Test product 9"
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_save_cancellation_items(django_assert_max_num_queries, cancellation, invoiceitems):
+    cancellation_data = [
+        {"product": "TESTPRODUCT0_B0", "confirmation": "T1"},
+        {"product": "TESTPRODUCT1_B0", "quantity": 10},
+        {"product": "TESTPRODUCT1_B0", "quantity": 5},
+    ]
+    with django_assert_max_num_queries(10):
+        CancellationItem.save_cancellation_items(
+            cancellation_data, cancellation)
+    cancelled_items = set(cancellation.items.values_list(
+        "product_id", "client_id", "confirmation_id", "quantity"))
+    assert cancelled_items == {
+        ("TESTPRODUCT0_B0", "C0", "T1", 30),
+        ("TESTPRODUCT1_B0", "C1", "T1", 15),
+    }
+    assert OpenQuantity.verify() == {}
+    with pytest.raises(ValueError):
+        CancellationItem.save_cancellation_items(
+            [{"product": "TESTPRODUCT1_B0", "quantity": 30}], cancellation)
+
+
+@pytest.mark.django_db
+def test_save_cancellation_items_with_unknown_invoiced(supplier, cancellation, invoiceitems):
+    invoice = Invoice.objects.create(
+        name="Invoice 3 311224.xlsx",
+        invoice_date="2024-12-31",
+        supplier=supplier,
+    )
+    InvoiceItem.save_invoice_items([
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 40, "price": 1.5},
+    ], invoice)
+    assert set(invoice.items.values_list("client_id", "quantity")) == {("Unknown", 40)}
+    CancellationItem.save_cancellation_items(
+        [{"product": "TESTPRODUCT0_B0", "confirmation": "T1"}], cancellation)
+    assert set(cancellation.items.values_list(
+        "product_id", "confirmation_id", "quantity")) == {("TESTPRODUCT0_B0", "T1", 30)}
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_register_products(django_assert_num_queries, products):
+    new_products = [
+        {"id": "TESTPRODUCT0_B0", "name": "Renamed product 0", "brand_id": "B0"},
+        {"id": "TESTPRODUCT1_B0", "name": "Test product 1", "brand_id": "B0"},
+        {"id": "TESTPRODUCT8_B0", "name": "Test product 8", "brand_id": "B0"},
+        {"id": "TESTPRODUCT9_B0", "name": "Test product 9", "brand_id": "B0"},
+    ]
+    with django_assert_num_queries(2):
+        registry = Product.register_products(new_products)
+    assert set(registry) == {product["id"] for product in new_products}
+    assert Product.objects.get(id="TESTPRODUCT0_B0").name != "Renamed product 0"
+    assert Product.objects.get(id="TESTPRODUCT9_B0").name == "Test product 9"
+    with django_assert_num_queries(2):
+        Product.register_products(
+            new_products, update_fields=["name", "brand_id"])
+    assert Product.objects.get(id="TESTPRODUCT0_B0").name == "Renamed product 0"
+    with django_assert_num_queries(1):
+        Product.register_products(new_products)
+
+
+@pytest.mark.django_db
+def test_register_products_audit(mocker, settings, products):
+    settings.DEBUG = False
+    delay = mocker.patch("orderflow_app.signals.log_action.delay")
+    existing = Product.objects.in_bulk(["TESTPRODUCT0_B0"])
+    mocker.patch.object(Product.objects, "in_bulk", side_effect=[{}, existing])
+    registry = Product.register_products([
+        {"id": "TESTPRODUCT0_B0", "name": "Renamed product 0", "brand_id": "B0"},
+        {"id": "TESTPRODUCT9_B0", "name": "Test product 9", "brand_id": "B0"},
+    ])
+    assert set(registry) == {"TESTPRODUCT0_B0", "TESTPRODUCT9_B0"}
+    assert Product.objects.get(id="TESTPRODUCT0_B0").name == "Test product 0"
+    delay.assert_called_once()
+    assert delay.call_args.args[0]["id"] == ["TESTPRODUCT0_B0", "TESTPRODUCT9_B0"]
+    with pytest.raises(IntegrityError):
+        Product.register_products([
+            {"id": "TESTPRODUCT8_B0", "second_id": "TP1", "brand_id": "B0"}])
+
+
+@pytest.mark.django_db
+def test_save_order_items(django_assert_max_num_queries, supplier, clients, products):
+    order = Order.objects.create(
+        name="Order 5-C0-B0-S0-01-01-2025",
+        order_date="2025-01-01",
+        supplier=supplier,
+    )
+    order_data_json = [
+        {"product": "TESTPRODUCT0_B0", "second_id": "TP0", "client": "C0", "quantity": 10},
+        {"product": "TESTPRODUCT0_B0", "second_id": "TP0", "client": "C0", "quantity": 5},
+        {"product": "TESTPRODUCT0_B0", "second_id": "TP0", "client": "C1", "quantity": 7},
+        {"product": "NEWPRODUCT_B0", "second_id": "NEWPRODUCT_B0", "client": "C1", "quantity": 3},
+        {"product": "total", "second_id": "", "client": "", "quantity": 25},
+    ]
+    with django_assert_max_num_queries(4):
+        OrderItem.save_order_items(order_data_json, order)
+    assert set(order.items.values_list("client_id", "product_id", "quantity")) == {
+        ("C0", "TESTPRODUCT0_B0", 15),
+        ("C1", "TESTPRODUCT0_B0", 7),
+        ("C1", "NEWPRODUCT_B0", 3),
+    }
+    assert Product.objects.get(id="NEWPRODUCT_B0").second_id is None
+    with pytest.raises(ValueError):
+        OrderItem.save_order_items(
+            [{"product": "TESTPRODUCT0_B0", "client": "C9", "quantity": 1}], order)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_save_invoice_items_concurrently(mocker, supplier, invoiceitems):
+    open_balances = OpenQuantity.open_balances
+
+    def slow_open_balances(*args, **kwargs):
+        balances = open_balances(*args, **kwargs)
+        time.sleep(0.5)
+        return balances
+
+    mocker.patch.object(OpenQuantity, "open_balances", slow_open_balances)
+    invoices = [Invoice.objects.create(
+        name=f"Invoice {i} 010125.xlsx",
+        invoice_date="2025-01-01",
+        supplier=supplier,
+    ) for i in range(3, 5)]
+    invoice_data_json = [
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 20, "price": 1.5},
+    ]
+
+    def save_invoice_items(invoice):
+        try:
+            InvoiceItem.save_invoice_items(invoice_data_json, invoice)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(save_invoice_items, invoices))
+    allocated_quantity = InvoiceItem.objects.filter(
+        invoice__in=invoices, confirmation__isnull=False).aggregate(
+            quantity=Sum("quantity"))["quantity"]
+    unknown_quantity = InvoiceItem.objects.filter(
+        invoice__in=invoices, client_id="Unknown").aggregate(
+            quantity=Sum("quantity"))["quantity"]
+    assert allocated_quantity == 30
+    assert unknown_quantity == 10
+    assert not OpenQuantity.objects.filter(
+        confirmation__isnull=False, quantity__lt=0).exists()
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_reallocate_orders(supplier, orders, orderitems):
+    confirmation = Confirmation.objects.create(
+        name="Confirmation 3 010125.xlsx",
+        confirmation_code="T3",
+        confirmation_date="2025-01-01",
+        supplier=supplier,
+    )
+    confirmation.order.add(orders.get("0"))
+    ConfirmationItem.save_confirmation_items([
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 45, "price": 1.5},
+        {"product": "TESTPRODUCT1_B0", "product_name": "Test product 1",
+            "quantity": 20, "price": 2},
+    ], confirmation)
+    confirmation.order.set([orders.get("2")])
+    ConfirmationItem.reallocate_orders(
+        confirmation, {orders.get("0").id}, {orders.get("2").id})
+    confirmed_items = set(confirmation.items.values_list(
+        "client_id", "product_id", "order_id", "quantity"))
+    assert confirmed_items == {
+        ("C0", "TESTPRODUCT0_B0", orders.get("2").id, 45),
+        ("Unknown", "TESTPRODUCT1_B0", None, 20),
+    }
+    confirmation.order.add(orders.get("1"))
+    ConfirmationItem.reallocate_orders(
+        confirmation, set(), {orders.get("1").id})
+    assert confirmation.items.get(product_id="TESTPRODUCT1_B0").order == orders.get("1")
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_save_invoice_items_with_plan(supplier, invoiceitems):
+    invoice_data_json = [
+        {"product": "TESTPRODUCT0_B0", "product_name": "Test product 0",
+            "quantity": 35, "price": 1.5},
+    ]
+    plan = InvoiceItem.stage_invoice_items(invoice_data_json, "2025-01-01")
+    assert [(item["client_id"], item["quantity"]) for item in plan["items"]] == [
+        ("C0", 30), ("Unknown", 5)]
+    stale_plan = InvoiceItem.stage_invoice_items(
+        invoice_data_json, "2025-01-01")
+    invoice = Invoice.objects.create(
+        name="Invoice 3 010125.xlsx", invoice_date="2025-01-01", supplier=supplier)
+    InvoiceItem.save_invoice_items(invoice_data_json, invoice, plan=plan)
+    assert set(invoice.items.values_list("client_id", "quantity")) == {
+        ("C0", 30), ("Unknown", 5)}
+    invoice = Invoice.objects.create(
+        name="Invoice 4 010125.xlsx", invoice_date="2025-01-01", supplier=supplier)
+    InvoiceItem.save_invoice_items(
+        invoice_data_json, invoice, plan=stale_plan)
+    assert set(invoice.items.values_list("client_id", "quantity")) == {
+        ("Unknown", 35)}
+    assert OpenQuantity.verify() == {}
+
+
+@pytest.mark.django_db
+def test_import_staging(settings):
+    data = [
+        {"product": "TESTPRODUCT0_B0", "quantity": 10, "price": 1.5},
+        {"product": "", "quantity": None, "price": None},
+    ]
+    plan = {
+        "invoice_date": "2025-01-01",
+        "stamp": "stamp",
+        "products": [{"id": "TESTPRODUCT0_B0", "name": None, "brand_id": "B0"}],
+        "items": [{"client_id": "Unknown", "product_id": "TESTPRODUCT0_B0",
+                   "confirmation_id": None, "order_id": None, "quantity": 10, "price": 1.5}],
+    }
+    token = ImportStaging.stage(ImportStaging.Kind.INVOICE, data, plan)
+    assert ImportStaging.load(ImportStaging.Kind.INVOICE, token) == (data, plan)
+    with pytest.raises(ValueError):
+        ImportStaging.load(ImportStaging.Kind.ORDER, token)
+    settings.IMPORT_STAGING_TTL = 0
+    expired_token = ImportStaging.stage(ImportStaging.Kind.ORDER, data, plan)
+    with pytest.raises(ValueError):
+        ImportStaging.load(ImportStaging.Kind.ORDER, expired_token)
+    assert ImportStaging.purge() == 1
+    assert list(ImportStaging.objects.values_list("token", flat=True)) == [token]
+
+
+@pytest.mark.django_db
+def test_with_totals(django_assert_num_queries, orderitems, invoiceitems, cancellationitem):
+    with django_assert_num_queries(3):
+        orders = list(Order.objects.with_totals())
+        confirmations = list(Confirmation.objects.with_totals())
+        invoices = list(Invoice.objects.with_totals())
+    for order in orders:
+        plain_order = Order.objects.get(pk=order.pk)
+        assert order.total_quantity == plain_order.total_quantity
+        assert order.cancelled_quantity == sum(
+            item.quantity for item in order.cancelled_items.all())
+    for document in confirmations + invoices:
+        plain_document = type(document).objects.get(pk=document.pk)
+        assert document.total_amount == plain_document.total_amount
+    assert confirmations[0].open_quantity == sum(
+        confirmations[0].open_quantities.values_list("quantity", flat=True))
+    for item in InvoiceItem.objects.with_totals():
+        assert item.total_amount == item.price * item.quantity
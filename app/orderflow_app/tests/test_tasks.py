@@ -1,6 +1,8 @@
 import pytest
 
-from ..tasks import create_backup
+from ..models.orders import Order
+from ..models.staging import ImportStaging, ImportJob
+from ..tasks import create_backup, purge_import_staging, run_import_job
 
 
 @pytest.mark.usefixtures('celery_session_app', 'celery_session_worker')
@@ -14,3 +16,40 @@ def test_create_backup(mocker):
     assert result['action'] == 'database_backup'
     mock_open.assert_called_once()
     mock_call_command.assert_called_once()
+
+
+@pytest.mark.usefixtures('celery_session_app', 'celery_session_worker')
+def test_purge_import_staging(mocker):
+    mock_purge = mocker.patch(
+        'orderflow_app.models.staging.ImportStaging.purge', return_value=2)
+
+    result = purge_import_staging.delay().get(timeout=10)
+
+    assert result['action'] == 'import_staging_purge'
+    assert result['deleted'] == 2
+    mock_purge.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_run_import_job(order_excel, clients, supplier):
+    job = ImportJob.objects.create(
+        kind=ImportStaging.Kind.ORDER,
+        supplier=supplier,
+        file_name=order_excel.name,
+        content=order_excel.read(),
+        document={
+            'name': order_excel.name,
+            'order_date': '2025-01-01',
+            'supplier': supplier.pk,
+            'comment': '',
+        },
+    )
+
+    result = run_import_job.apply((job.pk,)).get()
+
+    job.refresh_from_db()
+    assert result['status'] == ImportJob.Status.DONE
+    assert job.progress == 100
+    assert job.result == Order.name_into_id(order_excel.name)
+    assert Order.objects.get(pk=job.result).items.count() == 2
+    assert bytes(job.content) == b''
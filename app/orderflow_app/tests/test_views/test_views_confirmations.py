@@ -1,7 +1,10 @@
 import logging
+from hashlib import sha256
+from io import BytesIO
 from decimal import Decimal
 from datetime import date
 
+import pandas as pd
 import pytest
 from django.urls import reverse
 
@@ -148,7 +151,8 @@ def test_confirmation_create(client, confirmation_excel, orders, supplier, order
         'name': "Confirmation B0 010125.xlsx",
         'confirmation_date': date(2025, 1, 1),
         'supplier_id': 'T00016',
-        'comment': None
+        'comment': None,
+        'file_hash': sha256(confirmation_excel.file.getvalue()).hexdigest(),
     }]
     expected_items = [
         {'confirmation_id': 'T3',
@@ -181,7 +185,7 @@ def test_confirmation_view(client, confirmations, confirmationitems):
     assert confirmations.get("0").name.encode() in response.content
     for item in ConfirmationItem.objects.filter(confirmation_id=confirmation_id):
         assert item.product.id.encode() in response.content
-        assert item.client.id.encode() in response.content
+        assert item.client.name.encode() in response.content
         assert str(item.quantity).encode() in response.content
         assert str(item.price).encode() in response.content
     url = reverse('exportconfirmationtoexcel', kwargs={'pk': confirmation_id})
@@ -191,6 +195,22 @@ def test_confirmation_view(client, confirmations, confirmationitems):
     assert f'attachment; filename="data-{confirmation_id}.xlsx"' in response['Content-Disposition']
 
 
+@pytest.mark.django_db
+def test_confirmation_view_grid(client, django_assert_max_num_queries, confirmationitems):
+    confirmation_id = "T0"
+    url = reverse('viewconfirmation', kwargs={'pk': confirmation_id})
+    with django_assert_max_num_queries(6):
+        response = client.get(url)
+    grid = response.context['item_grid']
+    assert 'formset' not in response.context
+    items = ConfirmationItem.objects.filter(confirmation_id=confirmation_id).order_by('id')
+    assert grid.rows == [
+        (item.client.name, item.product_id, item.quantity, item.price,
+         item.price * item.quantity, item.order_id, item.comment)
+        for item in items]
+    assert b'id="item-grid-data"' in response.content
+
+
 @pytest.mark.django_db
 def test_confirmation_list_view(client, confirmations):
     url = reverse('confirmations')
@@ -199,3 +219,38 @@ def test_confirmation_list_view(client, confirmations):
     for confirmation in confirmations.values():
         assert confirmation.id.encode() in response.content
         assert confirmation.name.encode() in response.content
+
+
+@pytest.mark.django_db
+def test_confirmation_list_view_pages(client, settings, django_assert_max_num_queries,  # pylint: disable=R0913,R0917
+                                      supplier, confirmationitems, invoiceitems):
+    settings.LIST_PAGE_SIZE = 1
+    url = reverse('confirmations')
+    with django_assert_max_num_queries(4):
+        response = client.get(url, {'supplier': supplier.pk})
+    first_page = response.context['confirmations']
+    assert len(first_page) == 1
+    confirmation = first_page[0]
+    assert confirmation.items_amount == confirmation.total_amount
+    assert confirmation.open_quantity == sum(
+        confirmation.open_quantities.values_list('quantity', flat=True))
+    assert {invoice['invoice__id'] for invoice in confirmation.invoices} == set(
+        confirmation.invoiced_items.values_list('invoice_id', flat=True))
+    next_page_url = response.context['next_page_url']
+    assert f'supplier={supplier.pk}' in next_page_url
+    with django_assert_max_num_queries(4):
+        response = client.get(url + next_page_url)
+    assert [item.pk for item in response.context['confirmations']] == [
+        item.pk for item in Confirmation.objects.exclude(pk=confirmation.pk)]
+    assert response.context['next_page_url'] is None
+    response = client.get(url, {'date_from': '2025-01-02'})
+    assert not response.context['confirmations']
+
+
+@pytest.mark.django_db
+def test_confirmation_export_to_excel(client, confirmationitems):
+    url = reverse('exportconfirmationtoexcel', kwargs={'pk': 'T0'})
+    response = client.get(url)
+    exported = pd.read_excel(BytesIO(response.content))
+    expected = ConfirmationItem.objects.with_totals().filter(confirmation_id='T0')
+    assert sorted(exported['amount']) == sorted(float(item.amount) for item in expected)
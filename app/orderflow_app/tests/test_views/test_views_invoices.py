@@ -1,4 +1,5 @@
 import logging
+from hashlib import sha256
 from decimal import Decimal
 from datetime import date
 
@@ -128,10 +129,13 @@ def test_invoice_create(client, invoice_excel, supplier, confirmationitems):
         'file': [invoice_excel]
     }
     response = client.post(url, data=data,)
+    plan_token = response.context['plan_token']
+    assert b'plan-data' in response.content
     response = client.get(url)
     data.update({
         'csrfmiddlewaretoken': response.context['csrf_token'],
         'initial-invoice_date': [invoice_date],
+        'plan_token': [plan_token],
         'file': [''],
         'action': ['add'],
     })
@@ -152,7 +156,8 @@ def test_invoice_create(client, invoice_excel, supplier, confirmationitems):
         'name': "Test Invoice0 010125.xslx",
         'invoice_date': date(2025, 1, 1),
         'supplier_id': 'T00016',
-        'comment': None
+        'comment': None,
+        'file_hash': sha256(invoice_excel.file.getvalue()).hexdigest(),
     }]
     expected_items = [
         {'invoice_id': 'INVOICE0-010125',
@@ -187,7 +192,7 @@ def test_invoice_view(client, invoices, invoiceitems):
     assert invoices.get("0").name.encode() in response.content
     for item in InvoiceItem.objects.filter(invoice_id=invoice_id):
         assert item.product.id.encode() in response.content
-        assert item.client.id.encode() in response.content
+        assert item.client.name.encode() in response.content
         assert str(item.quantity).encode() in response.content
         assert str(item.price).encode() in response.content
     url = reverse('exportinvoicetoexcel', kwargs={'pk': invoice_id})
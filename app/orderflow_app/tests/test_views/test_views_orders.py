@@ -1,13 +1,17 @@
 import logging
+from hashlib import sha256
 from datetime import date
 
 import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
 
 from ...models.orders import (
     Order,
     OrderItem,
 )
+from ...models.staging import ImportJob
+from ...tasks import run_import_job
 
 log = logging.getLogger(__name__)
 
@@ -72,7 +76,7 @@ def test_order_update(client, orders, orderitems):
 
 
 @pytest.mark.django_db
-def test_order_create(client, order_excel, clients, supplier):
+def test_order_create(client, order_excel, clients, supplier):  # pylint: disable=R0914
     url = reverse('addorder')
     response = client.get(url)
     file_name_splitted = order_excel.name.split(".")[0].split("-")
@@ -104,7 +108,8 @@ def test_order_create(client, order_excel, clients, supplier):
         'name': "Order 3-C0-B0-T00016-01-01-2025.xlsx",
         'order_date': date(2025, 1, 1),
         'supplier_id': 'T00016',
-        'comment': None
+        'comment': None,
+        'file_hash': sha256(order_excel.file.getvalue()).hexdigest(),
     }]
     expected_items = [
         {'order_id': 'Order 3-C0-B0-T00016-01-01-2025',
@@ -118,6 +123,16 @@ def test_order_create(client, order_excel, clients, supplier):
     assert new_order.exists()
     assert list(new_order.values()) == expected_order
     assert new_items == expected_items
+    renamed_excel = SimpleUploadedFile(
+        "Order 4-C0-B0-T00016-01-01-2025.xlsx", order_excel.file.getvalue())
+    data.update({
+        'name': [renamed_excel.name],
+        'action': ['preview'],
+        'file': renamed_excel,
+    })
+    response = client.post(url, data=data)
+    assert f'File {renamed_excel.name} was already imported: {order_id}' in [
+        str(message) for message in response.context['messages']]
 
 
 @pytest.mark.django_db
@@ -130,7 +145,7 @@ def test_order_view(client, orders, orderitems):
     assert orders.get("0").name.encode() in response.content
     for item in OrderItem.objects.filter(order_id=order_id):
         assert item.product.id.encode() in response.content
-        assert item.client.id.encode() in response.content
+        assert item.client.name.encode() in response.content
         assert str(item.quantity).encode() in response.content
 
 
@@ -142,3 +157,95 @@ def test_order_list_view(client, orders):
     for order in orders.values():
         assert order.id.encode() in response.content
         assert order.name.encode() in response.content
+
+
+@pytest.mark.django_db
+def test_order_batch_create(client, settings, create_test_excel, clients, supplier):
+    settings.IMPORT_WORKERS = 2
+    url = reverse('addorders')
+    order_files = [next(create_test_excel(
+        {'product': ['P0', 'P.1'], 'quantity': [5 + i, 1]},
+        f"Order {i}-C{i}-B0-T00016-0{i + 1}-01-2025.xlsx")) for i in range(2)]
+    order_files.append(SimpleUploadedFile(
+        "Order 9-C0-B0-T00016-01-01-2025.xlsx", b"not an excel file"))
+    data = {
+        'supplier': supplier.id,
+        'mode': 'all',
+        'action': 'preview',
+        'files': order_files,
+    }
+    response = client.post(url, data=data)
+    entries = response.context['entries']
+    assert [entry['file'] for entry in entries] == [
+        order_file.name for order_file in order_files]
+    assert [entry['date'] for entry in entries[:2]] == ['2025-01-01', '2025-01-02']
+    assert 'error' not in entries[0] and 'error' not in entries[1]
+    assert entries[2]['error']
+    data.update({
+        'action': 'add',
+        'files': [],
+    })
+    response = client.post(url, data=data)
+    assert response.status_code == 200
+    assert list(OrderItem.objects.order_by('order_id', 'product_id').values_list(
+        'order_id', 'client_id', 'product_id', 'quantity')) == [
+        ('Order 0-C0-B0-T00016-01-01-2025', 'C0', 'P0_B0', 5),
+        ('Order 0-C0-B0-T00016-01-01-2025', 'C0', 'P1_B0', 1),
+        ('Order 1-C1-B0-T00016-02-01-2025', 'C1', 'P0_B0', 6),
+        ('Order 1-C1-B0-T00016-02-01-2025', 'C1', 'P1_B0', 1),
+    ]
+    assert [entry['file'] for entry in response.context['entries']] == [
+        order_files[2].name]
+
+
+@pytest.mark.django_db
+def test_order_create_in_background(client, order_excel, clients, supplier,  # pylint: disable=R0913,R0917
+                                    mocker, django_capture_on_commit_callbacks):
+    mock_delay = mocker.patch('orderflow_app.tasks.run_import_job.delay')
+    url = reverse('addorder')
+    response = client.get(url)
+    data = {
+        'csrfmiddlewaretoken': response.context['csrf_token'],
+        'name': [order_excel.name],
+        'order_date': '2025-01-01',
+        'supplier': [supplier.pk],
+        'comment': [''],
+        'action': ['enqueue'],
+        'file': order_excel
+    }
+    with django_capture_on_commit_callbacks(execute=True):
+        response = client.post(url, data=data)
+    job = response.context['job']
+    mock_delay.assert_called_once_with(job.pk)
+    assert job.document['order_date'] == '2025-01-01'
+    status_url = reverse('importjob', kwargs={'pk': job.pk})
+    assert client.get(status_url).json()['status'] == ImportJob.Status.PENDING
+    run_import_job.apply((job.pk,))
+    response = client.get(status_url).json()
+    assert response['status'] == ImportJob.Status.DONE
+    assert response['url'] == reverse(
+        'vieworder', kwargs={'pk': Order.name_into_id(order_excel.name)})
+
+
+@pytest.mark.django_db
+def test_order_list_view_pages(client, settings, django_assert_max_num_queries,
+                               confirmationitems, invoiceitems):
+    settings.LIST_PAGE_SIZE = 2
+    url = reverse('orders')
+    with django_assert_max_num_queries(6):
+        response = client.get(url)
+    first_page = response.context['orders']
+    assert len(first_page) == 2
+    for order in first_page:
+        assert order.ordered_quantity == sum(item.quantity for item in order.items.all())
+        assert order.confirmed_quantity == sum(
+            item.quantity for item in order.confirmed_items.all())
+        assert order.invoiced_quantity == sum(
+            item.quantity for item in order.invoiced_items.all())
+        assert {invoice['invoice__id'] for invoice in order.invoices} == set(
+            order.invoiced_items.values_list('invoice_id', flat=True))
+    response = client.get(url + response.context['next_page_url'])
+    assert response.context['next_page_url'] is None
+    assert response.context['first_page_url'] is not None
+    assert {order.pk for order in response.context['orders']} == set(
+        Order.objects.values_list('pk', flat=True)) - {order.pk for order in first_page}
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import views, directories, orders, confirmations, invoices, cancellations
+from .views import views, directories, orders, confirmations, invoices, cancellations, jobs
 
 
 urlpatterns = [
@@ -12,6 +12,7 @@ urlpatterns = [
 
     path('orders/', orders.OrderListView.as_view(), name="orders"),
     path('orders/add', orders.OrderCreateView.as_view(), name="addorder"),
+    path('orders/add/batch', orders.OrderBatchCreateView.as_view(), name="addorders"),
     path('orders/<str:pk>', orders.OrderDetailView.as_view(), name="vieworder"),
     path('orders/<str:pk>/edit/',
          orders.OrderUpdateView.as_view(), name="editorder"),
@@ -22,6 +23,8 @@ urlpatterns = [
          name="confirmations"),
     path('confirmations/add', confirmations.ConfirmationCreateView.as_view(),
          name="addconfirmation"),
+    path('confirmations/add/batch', confirmations.ConfirmationBatchCreateView.as_view(),
+         name="addconfirmations"),
     path('confirmations/<str:pk>',
          confirmations.ConfirmationDetailView.as_view(), name="viewconfirmation"),
     path('confirmations/<str:pk>/delete/',
@@ -30,9 +33,12 @@ urlpatterns = [
          confirmations.ConfirmationUpdateView.as_view(), name="editconfirmation"),
     path('confirmations/<str:pk>/exporttoexcel/',
          confirmations.export_confirmation_to_excel, name="exportconfirmationtoexcel"),
+    path('imports/<str:pk>', jobs.import_job_status, name="importjob"),
     path('invoices/', invoices.InvoiceListView.as_view(), name="invoices"),
     path('invoices/add', invoices.InvoiceCreateView.as_view(),
          name="addinvoice"),
+    path('invoices/add/batch', invoices.InvoiceBatchCreateView.as_view(),
+         name="addinvoices"),
     path('invoices/<str:pk>',
          invoices.InvoiceDetailView.as_view(), name="viewinvoice"),
     path('invoices/<str:pk>/delete/',
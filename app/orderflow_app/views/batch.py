@@ -0,0 +1,124 @@
+import logging
+from pathlib import Path
+
+from django.contrib import messages
+from django.db import transaction
+from django.shortcuts import redirect
+from django.views.generic import FormView
+
+from .. import parsers
+from ..forms.uploadfile import UploadFilesForm
+from ..importers import IMPORTERS
+from ..models.staging import ImportStaging
+
+log = logging.getLogger(__name__)
+
+template_path = Path("orderflow_app")
+
+
+class BatchCreateView(FormView):
+    form_class = UploadFilesForm
+    template_name = template_path/"batchimport.html"
+    kind = None
+
+    @property
+    def importer(self):
+        return IMPORTERS[self.kind]
+
+    @property
+    def session_key(self):
+        return f'{self.kind}_batch'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        entries = self.request.session.get(self.session_key, [])
+        context.update({
+            'title': f'New {self.kind}s from files',
+            'kind': self.kind,
+            'entries': entries,
+            'add_disabled': not any(not entry.get('error') for entry in entries),
+        })
+        return context
+
+    def preview_file(self, form, uploaded_file, parsed):
+        try:
+            if isinstance(parsed, Exception):
+                raise parsed
+            supplier = form.cleaned_data['supplier']
+            document_date = parsers.get_parser(supplier, self.kind).document_date(
+                uploaded_file.name) or form.cleaned_data['document_date']
+            if document_date is None:
+                raise ValueError("No date in file name, set the date")
+            document = self.importer.document_data(
+                supplier, uploaded_file.name, document_date,
+                [order.pk for order in form.cleaned_data.get('order', [])])
+            return self.importer.stage(uploaded_file, parsed, document)
+        except Exception as e:  # pylint: disable=W0718
+            return {'file': uploaded_file.name, 'error': str(e)}
+
+    def discard_entries(self):
+        for entry in self.request.session.pop(self.session_key, []):
+            if token := entry.get('token'):
+                ImportStaging.discard(token)
+
+    def preview(self, form):
+        uploaded_files = form.cleaned_data['files']
+        if not uploaded_files:
+            messages.error(self.request, 'No files selected. Choose files')
+            return self.render_to_response(self.get_context_data(form=form))
+        try:
+            results = parsers.parse_files(
+                uploaded_files, form.cleaned_data['supplier'], self.kind)
+        except Exception as e:  # pylint: disable=W0718
+            messages.error(self.request, f'Cannot upload files, {e}')
+            return self.render_to_response(self.get_context_data(form=form))
+        self.discard_entries()
+        self.request.session[self.session_key] = [
+            self.preview_file(form, uploaded_file, parsed)
+            for uploaded_file, parsed in zip(uploaded_files, results)]
+        return self.render_to_response(self.get_context_data(form=form))
+
+    def add(self, form):
+        entries = self.request.session.get(self.session_key, [])
+        staged = sorted((entry for entry in entries if not entry.get('error')),
+                        key=lambda entry: (entry['date'], entry['file']))
+        if not staged:
+            messages.error(self.request, 'No files to save. Preview files first')
+            return self.render_to_response(self.get_context_data(form=form))
+        saved = []
+        if form.cleaned_data['mode'] == UploadFilesForm.ALL_FILES:
+            current = staged[0]
+            try:
+                with transaction.atomic():
+                    for current in staged:
+                        self.importer.save(current)
+            except Exception as e:  # pylint: disable=W0718
+                messages.error(
+                    self.request, f'Cannot save {current["file"]}, {e}. No files are saved')
+                return self.render_to_response(self.get_context_data(form=form))
+            saved = staged
+        else:
+            for entry in staged:
+                try:
+                    with transaction.atomic():
+                        self.importer.save(entry)
+                    saved.append(entry)
+                except Exception as e:  # pylint: disable=W0718
+                    entry['error'] = str(e)
+                    messages.error(self.request, f'Cannot save {entry["file"]}, {e}')
+        if saved:
+            messages.success(self.request, f'{len(saved)} {self.kind}s are created')
+        remaining = [entry for entry in entries if entry not in saved]
+        if not remaining:
+            self.request.session.pop(self.session_key, None)
+            return redirect(self.get_success_url())
+        self.request.session[self.session_key] = remaining
+        return self.render_to_response(self.get_context_data(form=form))
+
+    def form_valid(self, form):
+        action = self.request.POST.get('action')
+        if action == 'preview':
+            return self.preview(form)
+        if action == 'add':
+            return self.add(form)
+        return self.render_to_response(self.get_context_data(form=form))
@@ -1,68 +1,94 @@
 import json
 import logging
+from collections import defaultdict
 from pathlib import Path
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.db import transaction
+from django.db.models import Prefetch
 from django.http import HttpResponse
 from django.contrib import messages
 from django.shortcuts import redirect
-from django.db.models import F
 
+from ..models.orders import Order
 from ..models.confirmations import Confirmation, ConfirmationItem, ConfirmationDelivery
+from ..models.invoices import InvoiceItem
+from ..models.staging import ImportStaging
 from ..forms.confirmations import (
     ConfirmationModelForm,
     EditConfirmationModelForm,
     ViewConfirmationModelForm,
     ViewConfirmationItemFormSet,
-    EditConfirmationItemFormSet)
-from ..forms.uploadfile import UploadConfirmationForm
+    EditConfirmationItemFormSet,
+    ConfirmationFilterForm)
+from ..forms.uploadfile import UploadConfirmationForm, UploadConfirmationFilesForm
+from .batch import BatchCreateView
+from .grid import ItemGrid
+from .jobs import ImportJobMixin
+from .pagination import KeysetPaginationMixin
 
 log = logging.getLogger(__name__)
 
 template_path = Path("orderflow_app") / "confirmations"
 
 
-class ConfirmationListView(ListView):
+class ConfirmationListView(KeysetPaginationMixin, ListView):
     model = Confirmation
     template_name = template_path/"confirmations.html"
     context_object_name = "confirmations"
+    filter_form_class = ConfirmationFilterForm
+    filter_form = None
+    keyset = ("-confirmation_date", "name", "id")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
-            "title": self.context_object_name.capitalize()
+            "title": self.context_object_name.capitalize(),
+            "filter_form": self.filter_form,
         })
-        for confirmation in context[self.context_object_name]:
-            confirmation.invoices = confirmation.invoiced_items.select_related(
-                'invoice').values('invoice__name', 'invoice__id').distinct()
+        confirmations = context[self.context_object_name]
+        invoices = defaultdict(list)
+        for invoice in InvoiceItem.objects.filter(confirmation__in=confirmations).values(
+                'confirmation_id', 'invoice__id', 'invoice__name').distinct().order_by(
+                'confirmation_id', 'invoice__id'):
+            invoices[invoice['confirmation_id']].append(invoice)
+        for confirmation in confirmations:
+            confirmation.invoices = invoices[confirmation.id]
         return context
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-confirmation_date", "name")
+        self.filter_form = self.filter_form_class(self.request.GET or None)
+        return self.filter_form.filter(super().get_queryset()).prefetch_related(
+            Prefetch('order', queryset=Order.objects.only('id', 'name')),
+        ).with_totals()
 
 
 class ConfirmationDetailView(DetailView):
     model = Confirmation
     model_item = ConfirmationItem
     form_class = ViewConfirmationModelForm
-    formset_class = ViewConfirmationItemFormSet
+    grid_columns = {
+        'Client': 'client__name',
+        'Product': 'product_id',
+        'Quantity': 'quantity',
+        'Price': 'price',
+        'Amount': 'amount',
+        'Order': 'order_id',
+        'Comment': 'comment',
+    }
     template_name = template_path/"viewconfirmation.html"
     context_object_name = 'viewconfirmation'
 
+    def get_queryset(self):
+        return super().get_queryset().with_totals()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        confirmation = self.get_object()
-        confirmation_items = self.model_item.objects.select_related(
-            'client',
-            'product'
-        ).filter(
-            confirmation=confirmation)
+        confirmation = self.object
+        confirmation_items = self.model_item.objects.with_totals().filter(
+            confirmation=confirmation).order_by('id')
         confirmation_form = self.form_class(instance=confirmation)
-        confirmation_items_formset = self.formset_class(
-            queryset=confirmation_items,
-            form_kwargs={'confirmation': confirmation})
         non_client_products = list(confirmation_items.filter(
             client_id="Unknown").values_list('product', flat=True))
         if non_client_products:
@@ -71,7 +97,7 @@ class ConfirmationDetailView(DetailView):
         context.update({
             'title': f'Confirmation: {confirmation.name}',
             'confirmation_form': confirmation_form,
-            'formset': confirmation_items_formset,
+            'item_grid': ItemGrid(confirmation_items, self.grid_columns),
             'view_confirmation': True,
         })
         return context
@@ -122,28 +148,15 @@ class ConfirmationUpdateView(UpdateView):
     def get_success_url(self):
         return reverse_lazy('viewconfirmation', kwargs={'pk': self.object.pk})
 
-    def order_has_changed(self, form):
-        order = form.cleaned_data["order"]
-        initial_order = self.get_object().order.all()
-        if len(order) == len(initial_order):
-            for item in order:
-                if item not in initial_order:
-                    return True
-            return False
-        return True
-
-    def apply_new_order(self, confirmation):
-        confirmation_data_json = list(confirmation.items.annotate(
-            product_name=F('product__name')
-        ).values(
-            'product',
-            'quantity',
-            'price',
-            'product_name'
-        ))
-        confirmation.items.all().delete()
-        self.model_item.save_confirmation_items(
-            confirmation_data_json, confirmation)
+    def order_changes(self, form):
+        order_ids = {order.pk for order in form.cleaned_data["order"]}
+        initial_order_ids = set(
+            self.get_object().order.values_list("pk", flat=True))
+        return initial_order_ids - order_ids, order_ids - initial_order_ids
+
+    def apply_new_order(self, confirmation, removed_order_ids, added_order_ids):
+        self.model_item.reallocate_orders(
+            confirmation, removed_order_ids, added_order_ids)
 
     def dispatch(self, request, *args, **kwargs):
         response = super().dispatch(request, *args, **kwargs)
@@ -163,10 +176,11 @@ class ConfirmationUpdateView(UpdateView):
             formset = self.formset_class(
                 self.request.POST, form_kwargs={'confirmation': confirmation})
             if form.is_valid() and formset.is_valid():
-                order_has_changed = self.order_has_changed(form)
+                removed_order_ids, added_order_ids = self.order_changes(form)
                 form.save()
-                if order_has_changed:
-                    self.apply_new_order(confirmation)
+                if removed_order_ids or added_order_ids:
+                    self.apply_new_order(
+                        confirmation, removed_order_ids, added_order_ids)
                     messages.warning(
                         self.request, 'New order has been applied to set clients')
                     return super().form_valid(form)
@@ -183,7 +197,8 @@ class ConfirmationUpdateView(UpdateView):
         return self.render_to_response(context)
 
 
-class ConfirmationCreateView(CreateView):
+class ConfirmationCreateView(ImportJobMixin, CreateView):
+    kind = ImportStaging.Kind.CONFIRMATION
     model = Confirmation
     model_item = ConfirmationItem
     model_delivery = ConfirmationDelivery
@@ -206,14 +221,28 @@ class ConfirmationCreateView(CreateView):
     def get_success_url(self):
         return reverse_lazy('viewconfirmation', kwargs={'pk': self.object.pk})
 
-    def form_valid(self, form):  # pylint: disable=R1710
+    def stage(self, data_json, orders, file_hash=None):
+        data_json = json.loads(data_json)
+        plan = self.model_item.stage_confirmation_items(data_json, orders)
+        ImportStaging.discard(self.request.session.get('confirmation_token'))
+        self.request.session['confirmation_token'] = ImportStaging.stage(
+            ImportStaging.Kind.CONFIRMATION, data_json, plan, file_hash=file_hash)
+        return plan
+
+    def form_valid(self, form):  # pylint: disable=R1710,R0914
         context = self.get_context_data()
         loadform = self.loadform_class(self.request.POST, self.request.FILES)
         action = self.request.POST.get('action')
+        if action == 'enqueue':
+            return self.enqueue(form, context)
         if action == 'preview':
             if uploaded_file := self.request.FILES.get('file'):
                 try:
                     supplier = form.cleaned_data["supplier"]
+                    file_hash = loadform.file_hash(uploaded_file)
+                    if imported := loadform.imported_documents(self.model, file_hash):
+                        messages.warning(
+                            self.request, f'File {uploaded_file} was already imported: {", ".join(imported)}')
                     confirmation_code, confirmation_data = loadform.load_excel_confirmation(
                         uploaded_file, supplier=supplier)
                     current_values = {
@@ -221,11 +250,13 @@ class ConfirmationCreateView(CreateView):
                     }
                     form.instance.confirmation_code = confirmation_code
                     form.save(commit=False)
-                    self.request.session['confirmation_data_json'] = loadform.data_json(
-                        confirmation_data)
+                    plan = self.stage(loadform.data_json(confirmation_data),
+                                      list(form.cleaned_data['order']), file_hash)
                     context.update({
                         'form': self.form_class(instance=form.instance, initial=current_values),
                         'confirmationdata': confirmation_data,
+                        'plan': plan,
+                        'plan_token': self.request.session['confirmation_token'],
                         'add_confirmation_disabled': False,
                     })
                 except Exception as e:  # pylint: disable=W0718
@@ -242,15 +273,18 @@ class ConfirmationCreateView(CreateView):
             return self.render_to_response(context)
         if action == 'add':
             if form.is_valid() and loadform.is_valid():
-                confirmation_data_json = json.loads(
-                    self.request.session.get('confirmation_data_json'))
+                token = self.request.POST.get(
+                    'plan_token', self.request.session.get('confirmation_token'))
                 try:
+                    confirmation_data_json, plan = ImportStaging.load(
+                        ImportStaging.Kind.CONFIRMATION, token)
                     with transaction.atomic():
+                        form.instance.file_hash = plan.get('file_hash', "")
                         confirmation = form.save(commit=False)
                         confirmation.save()
                         form.save_m2m()
                         self.model_item.save_confirmation_items(
-                            confirmation_data_json=confirmation_data_json, confirmation=confirmation)
+                            confirmation_data_json=confirmation_data_json, confirmation=confirmation, plan=plan)
                         self.model_delivery.save_confirmation_delivery(
                             confirmation_data_json=confirmation_data_json, confirmation=confirmation)
                 except Exception as e:  # pylint: disable=W0718
@@ -259,11 +293,18 @@ class ConfirmationCreateView(CreateView):
                         'add_confirmation_disabled': True,
                     })
                     return self.render_to_response(context)
-                del self.request.session['confirmation_data_json']
+                ImportStaging.discard(token)
+                self.request.session.pop('confirmation_token', None)
                 messages.success(self.request, 'Confirmation is created')
                 return super().form_valid(form)
 
 
+class ConfirmationBatchCreateView(BatchCreateView):
+    form_class = UploadConfirmationFilesForm
+    kind = ImportStaging.Kind.CONFIRMATION
+    success_url = reverse_lazy('confirmations')
+
+
 def export_confirmation_to_excel(request, pk):
     confirmation = Confirmation.objects.get(id=pk)
     confirmation_items = ConfirmationItem.objects.filter(
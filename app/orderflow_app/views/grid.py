@@ -0,0 +1,19 @@
+class ItemGrid:
+    row_height = 38
+    visible_rows = 25
+
+    def __init__(self, queryset, columns):
+        self.labels = list(columns)
+        self.rows = list(queryset.values_list(*columns.values()))
+
+    @property
+    def height(self):
+        return (min(len(self.rows), self.visible_rows) + 1) * self.row_height + 2
+
+    @property
+    def data(self):
+        return {
+            'columns': self.labels,
+            'rows': self.rows,
+            'rowHeight': self.row_height,
+        }
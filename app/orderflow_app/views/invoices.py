@@ -10,6 +10,7 @@ from django.http import HttpResponse
 
 
 from ..models.invoices import Invoice, InvoiceItem
+from ..models.staging import ImportStaging
 from ..forms.invoices import (
     InvoiceModelForm,
     ViewInvoiceModelForm,
@@ -18,6 +19,9 @@ from ..forms.invoices import (
     EditInvoiceItemFormSet,
 )
 from ..forms.uploadfile import UploadInvoiceForm
+from .batch import BatchCreateView
+from .grid import ItemGrid
+from .jobs import ImportJobMixin
 
 log = logging.getLogger(__name__)
 
@@ -30,7 +34,7 @@ class InvoiceListView(ListView):
     context_object_name = "invoices"
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-invoice_date", "name")
+        return super().get_queryset().with_totals().order_by("-invoice_date", "name")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -44,22 +48,28 @@ class InvoiceDetailView(DetailView):
     model = Invoice
     model_item = InvoiceItem
     form_class = ViewInvoiceModelForm
-    formset_class = ViewInvoiceItemFormSet
+    grid_columns = {
+        'Client': 'client__name',
+        'Product': 'product_id',
+        'Quantity': 'quantity',
+        'Price': 'price',
+        'Amount': 'amount',
+        'Confirmation': 'confirmation_id',
+        'Order': 'order_id',
+        'Comment': 'comment',
+    }
     template_name = template_path/"viewinvoice.html"
     context_object_name = 'viewinvoice'
 
+    def get_queryset(self):
+        return super().get_queryset().with_totals()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        invoice = self.get_object()
-        invoice_items = self.model_item.objects.select_related(
-            'client',
-            'product'
-        ).filter(
-            invoice=invoice)
+        invoice = self.object
+        invoice_items = self.model_item.objects.with_totals().filter(
+            invoice=invoice).order_by('id')
         invoice_form = self.form_class(instance=invoice)
-        invoice_items_formset = self.formset_class(
-            queryset=invoice_items,
-            form_kwargs={'invoice': invoice})
         non_client_products = list(invoice_items.filter(
             client_id="Unknown").values_list('product', flat=True))
         if non_client_products:
@@ -68,7 +78,7 @@ class InvoiceDetailView(DetailView):
         context.update({
             'title': f'Invoice: {invoice.name}',
             'invoice_form': invoice_form,
-            'formset': invoice_items_formset,
+            'item_grid': ItemGrid(invoice_items, self.grid_columns),
             'view_invoice': True,
         })
         return context
@@ -134,7 +144,8 @@ class InvoiceUpdateView(UpdateView):
         return self.render_to_response(context)
 
 
-class InvoiceCreateView(CreateView):
+class InvoiceCreateView(ImportJobMixin, CreateView):
+    kind = ImportStaging.Kind.INVOICE
     model = Invoice
     model_item = InvoiceItem
     form_class = InvoiceModelForm
@@ -156,23 +167,36 @@ class InvoiceCreateView(CreateView):
     def get_success_url(self):
         return reverse_lazy('viewinvoice', kwargs={'pk': self.object.pk})
 
-    def form_valid(self, form):  # pylint: disable=R1710
+    def form_valid(self, form):  # pylint: disable=R1710,R0914
         context = self.get_context_data()
         loadform = self.loadform_class(self.request.POST, self.request.FILES)
         action = self.request.POST.get('action')
+        if action == 'enqueue':
+            return self.enqueue(form, context)
         if action == 'preview':
             if uploaded_file := self.request.FILES.get('file'):
                 try:
                     supplier = form.cleaned_data["supplier"]
+                    file_hash = loadform.file_hash(uploaded_file)
+                    if imported := loadform.imported_documents(self.model, file_hash):
+                        messages.warning(
+                            self.request, f'File {uploaded_file} was already imported: {", ".join(imported)}')
                     invoice_id, invoice_data = loadform.load_excel_invoice(
                         uploaded_file, supplier=supplier)
                     form.instance.invoice_id = invoice_id
                     form.save(commit=False)
-                    self.request.session['invoice_data_json'] = loadform.data_json(
-                        invoice_data)
+                    data_json = json.loads(loadform.data_json(invoice_data))
+                    plan = self.model_item.stage_invoice_items(
+                        data_json, form.cleaned_data['invoice_date'])
+                    ImportStaging.discard(
+                        self.request.session.get('invoice_token'))
+                    self.request.session['invoice_token'] = ImportStaging.stage(
+                        ImportStaging.Kind.INVOICE, data_json, plan, file_hash=file_hash)
                     context.update({
                         'form': self.form_class(instance=form.instance),
                         'invoicedata': invoice_data,
+                        'plan': plan,
+                        'plan_token': self.request.session['invoice_token'],
                         'add_invoice_disabled': False,
                     })
                 except Exception as e:  # pylint: disable=W0718
@@ -189,26 +213,35 @@ class InvoiceCreateView(CreateView):
             return self.render_to_response(context)
         if action == 'add':
             if form.is_valid() and loadform.is_valid():
-                invoice_data_json = json.loads(
-                    self.request.session.get('invoice_data_json'))
+                token = self.request.POST.get(
+                    'plan_token', self.request.session.get('invoice_token'))
                 try:
+                    invoice_data_json, plan = ImportStaging.load(
+                        ImportStaging.Kind.INVOICE, token)
                     with transaction.atomic():
+                        form.instance.file_hash = plan.get('file_hash', "")
                         invoice = form.save(commit=False)
                         invoice.save()
                         form.save_m2m()
                         self.model_item.save_invoice_items(
-                            invoice_data_json=invoice_data_json, invoice=invoice)
+                            invoice_data_json=invoice_data_json, invoice=invoice, plan=plan)
                 except Exception as e:  # pylint: disable=W0718
                     messages.error(self.request, f'Cannot save data, {e}')
                     context.update({
                         'add_invoice_disabled': True,
                     })
                     return self.render_to_response(context)
-                del self.request.session['invoice_data_json']
+                ImportStaging.discard(token)
+                self.request.session.pop('invoice_token', None)
                 messages.success(self.request, 'Invoice is created')
                 return super().form_valid(form)
 
 
+class InvoiceBatchCreateView(BatchCreateView):
+    kind = ImportStaging.Kind.INVOICE
+    success_url = reverse_lazy('invoices')
+
+
 def export_invoice_to_excel(request, pk):
     invoice = Invoice.objects.get(id=pk)
     invoice_items = InvoiceItem.objects.filter(
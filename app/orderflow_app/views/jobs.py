@@ -0,0 +1,64 @@
+import logging
+from functools import partial
+
+from django.contrib import messages
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+
+from ..importers import IMPORTERS
+from ..models.staging import ImportStaging, ImportJob
+from ..tasks import run_import_job
+
+log = logging.getLogger(__name__)
+
+DOCUMENT_URLS = {
+    ImportStaging.Kind.ORDER: 'vieworder',
+    ImportStaging.Kind.CONFIRMATION: 'viewconfirmation',
+    ImportStaging.Kind.INVOICE: 'viewinvoice',
+}
+
+
+class ImportJobMixin:
+    kind = None
+
+    def enqueue(self, form, context):
+        uploaded_file = self.request.FILES.get('file')
+        if not uploaded_file:
+            messages.error(self.request, 'No file selected. Choose file')
+            return self.render_to_response(context)
+        importer = IMPORTERS[self.kind]
+        supplier = form.cleaned_data['supplier']
+        document = {
+            **importer.document_data(
+                supplier, form.cleaned_data['name'], form.cleaned_data[importer.date_field],
+                [order.pk for order in form.cleaned_data.get('order', [])]),
+            'comment': form.cleaned_data.get('comment') or '',
+        }
+        job = ImportJob.objects.create(
+            kind=self.kind,
+            supplier=supplier,
+            file_name=uploaded_file.name,
+            content=uploaded_file.read(),
+            document=document,
+        )
+        transaction.on_commit(partial(run_import_job.delay, job.pk))
+        messages.info(self.request, f'Import of {uploaded_file} is started')
+        context.update({
+            'job': job,
+        })
+        return self.render_to_response(context)
+
+
+def import_job_status(request, pk):
+    job = get_object_or_404(ImportJob, pk=pk)
+    return JsonResponse({
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'url': reverse(DOCUMENT_URLS[job.kind], kwargs={'pk': job.result})
+        if job.status == ImportJob.Status.DONE else None,
+    })
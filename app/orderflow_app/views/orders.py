@@ -1,14 +1,19 @@
 import json
 import logging
+from collections import defaultdict
 from pathlib import Path
 
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy
 from django.db import transaction
+from django.db.models import Prefetch
 from django.contrib import messages
 from django.shortcuts import redirect
 
 from ..models.orders import Order, OrderItem
+from ..models.confirmations import Confirmation
+from ..models.invoices import InvoiceItem
+from ..models.staging import ImportStaging
 from ..forms.orders import (
     OrderModelForm,
     EditOrderModelForm,
@@ -17,52 +22,66 @@ from ..forms.orders import (
     EditOrderItemFormSet,
 )
 from ..forms.uploadfile import UploadOrderForm
+from .batch import BatchCreateView
+from .grid import ItemGrid
+from .jobs import ImportJobMixin
+from .pagination import KeysetPaginationMixin
 
 log = logging.getLogger(__name__)
 
 template_path = Path("orderflow_app") / "orders"
 
 
-class OrderListView(ListView):
+class OrderListView(KeysetPaginationMixin, ListView):
     model = Order
     template_name = template_path/"orders.html"
     context_object_name = "orders"
+    keyset = ("-order_date", "name", "id")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context.update({
             "title": self.context_object_name.capitalize()
         })
-        for order in context[self.context_object_name]:
-            order.invoices = order.invoiced_items.select_related(
-                'invoice').values('invoice__name', 'invoice__id').distinct()
+        orders = context[self.context_object_name]
+        invoices = defaultdict(list)
+        for invoice in InvoiceItem.objects.filter(order__in=orders).values(
+                'order_id', 'invoice__id', 'invoice__name').distinct().order_by('order_id', 'invoice__id'):
+            invoices[invoice['order_id']].append(invoice)
+        for order in orders:
+            order.invoices = invoices[order.id]
         return context
 
     def get_queryset(self):
-        return super().get_queryset().order_by("-order_date", "name")
+        return super().get_queryset().prefetch_related(
+            Prefetch('confirmations', queryset=Confirmation.objects.only('id', 'name')),
+        ).with_totals()
 
 
 class OrderDetailView(DetailView):
     model = Order
     model_item = OrderItem
     form_class = ViewOrderModelForm
-    formset_class = ViewOrderItemFormSet
+    grid_columns = {
+        'Client': 'client__name',
+        'Product': 'product_id',
+        'Quantity': 'quantity',
+    }
     template_name = template_path/"vieworder.html"
     context_object_name = 'vieworder'
 
+    def get_queryset(self):
+        return super().get_queryset().with_totals()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        order = self.get_object()
-        order_items = self.model_item.objects.select_related(
-            'client',
-            'product'
-        ).filter(order=order)
+        order = self.object
+        order_items = self.model_item.objects.filter(order=order).order_by('id')
         order_form = self.form_class(instance=order)
-        formset = self.formset_class(queryset=order_items)
         context.update({
             'title': f'Order: {order.name}',
             'order_form': order_form,
-            'formset': formset,
+            'item_grid': ItemGrid(order_items, self.grid_columns),
             'view_order': True,
         })
         return context
@@ -150,7 +169,8 @@ class OrderUpdateView(UpdateView):
         return self.render_to_response(context)
 
 
-class OrderCreateView(CreateView):
+class OrderCreateView(ImportJobMixin, CreateView):
+    kind = ImportStaging.Kind.ORDER
     model = Order
     model_item = OrderItem
     form_class = OrderModelForm
@@ -172,20 +192,33 @@ class OrderCreateView(CreateView):
     def get_success_url(self):
         return reverse_lazy('orders')
 
-    def form_valid(self, form):  # pylint: disable=R1710
+    def form_valid(self, form):  # pylint: disable=R1710,R0914
         context = self.get_context_data()
         loadform = self.loadform_class(self.request.POST, self.request.FILES)
         action = self.request.POST.get('action')
+        if action == 'enqueue':
+            return self.enqueue(form, context)
         if action == 'preview':
             if uploaded_file := self.request.FILES.get('file'):
                 try:
                     supplier = form.cleaned_data["supplier"]
+                    file_hash = loadform.file_hash(uploaded_file)
+                    if imported := loadform.imported_documents(self.model, file_hash):
+                        messages.warning(
+                            self.request, f'File {uploaded_file} was already imported: {", ".join(imported)}')
                     order_data = loadform.load_excel_order(
                         uploaded_file, supplier=supplier)
-                    self.request.session['order_data_json'] = loadform.data_json(
-                        order_data)
+                    data_json = json.loads(loadform.data_json(order_data))
+                    plan = self.model_item.stage_order_items(
+                        data_json)
+                    ImportStaging.discard(
+                        self.request.session.get('order_token'))
+                    self.request.session['order_token'] = ImportStaging.stage(
+                        ImportStaging.Kind.ORDER, data_json, plan, file_hash=file_hash)
                     context.update({
                         'orderdata': order_data,
+                        'plan': plan,
+                        'plan_token': self.request.session['order_token'],
                         'add_order_disabled': False,
                     })
                 except Exception as e:  # pylint: disable=W0718
@@ -202,19 +235,28 @@ class OrderCreateView(CreateView):
             return self.render_to_response(context)
         if action == 'add':
             if form.is_valid() and loadform.is_valid():
-                order_data_json = json.loads(
-                    self.request.session.get('order_data_json'))
+                token = self.request.POST.get(
+                    'plan_token', self.request.session.get('order_token'))
                 try:
+                    order_data_json, plan = ImportStaging.load(
+                        ImportStaging.Kind.ORDER, token)
                     with transaction.atomic():
+                        form.instance.file_hash = plan.get('file_hash', "")
                         order = form.save()
                         self.model_item.save_order_items(
-                            order_data_json=order_data_json, order=order)
+                            order_data_json=order_data_json, order=order, plan=plan)
                 except Exception as e:  # pylint: disable=W0718
                     messages.error(self.request, f'Cannot save data, {e}')
                     context.update({
                         'add_order_disabled': True,
                     })
                     return self.render_to_response(context)
-                del self.request.session['order_data_json']
+                ImportStaging.discard(token)
+                self.request.session.pop('order_token', None)
                 messages.success(self.request, 'Order is created')
                 return super().form_valid(form)
+
+
+class OrderBatchCreateView(BatchCreateView):
+    kind = ImportStaging.Kind.ORDER
+    success_url = reverse_lazy('orders')
@@ -0,0 +1,66 @@
+import logging
+from datetime import date
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+
+log = logging.getLogger(__name__)
+
+
+class KeysetPaginationMixin:
+    keyset = ("-pk",)
+    cursor_param = "after"
+    next_page_url = None
+    first_page_url = None
+
+    def get_paginate_by(self, queryset):
+        return self.paginate_by or settings.LIST_PAGE_SIZE
+
+    def get_cursor(self):
+        if cursor := self.request.GET.get(self.cursor_param):
+            try:
+                return signing.loads(cursor, salt=self.cursor_param)
+            except signing.BadSignature:
+                log.warning("Bad page cursor %s", cursor)
+        return None
+
+    def keyset_filter(self, values):
+        result = Q()
+        equal = Q()
+        for field, value in zip(self.keyset, values):
+            name = field.lstrip("-")
+            result |= equal & Q(**{f'{name}__{"lt" if field.startswith("-") else "gt"}': value})
+            equal &= Q(**{name: value})
+        return result
+
+    def keyset_values(self, row):
+        values = [getattr(row, field.lstrip("-")) for field in self.keyset]
+        return [value.isoformat() if isinstance(value, date) else value for value in values]
+
+    def page_url(self, cursor=None):
+        query = self.request.GET.copy()
+        query.pop(self.cursor_param, None)
+        if cursor is not None:
+            query[self.cursor_param] = cursor
+        return f'?{query.urlencode()}'
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.get_cursor()
+        if cursor is not None:
+            queryset = queryset.filter(self.keyset_filter(cursor))
+        rows = list(queryset.order_by(*self.keyset)[:page_size + 1])
+        has_next = len(rows) > page_size
+        rows = rows[:page_size]
+        self.next_page_url = self.page_url(signing.dumps(
+            self.keyset_values(rows[-1]), salt=self.cursor_param)) if has_next else None
+        self.first_page_url = self.page_url() if cursor is not None else None
+        return None, None, rows, has_next
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update({
+            'next_page_url': self.next_page_url,
+            'first_page_url': self.first_page_url,
+        })
+        return context